@@ -0,0 +1,98 @@
+"""
+Sends a control message to a running grpc_client.py over its WebSocket port and
+prints the reply.
+
+    python a2f_control.py stats
+    python a2f_control.py profile --seconds 10
+    python a2f_control.py drain --wait     # graceful restart under PM2, see backend/README.md
+    python a2f_control.py reload --wait
+
+"profile", "reload" and "drain" need a loopback connection or --token (default
+A2F_CONTROL_TOKEN). With --wait, "drain" and "reload" block until a new process
+has taken over and reports ready.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+
+import websockets
+from dotenv import load_dotenv
+
+# Same .env as grpc_client.py, so the port and token match the running client
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
+
+WS_PORT = int(os.getenv("A2F_WS_PORT", "8765"))
+DRAIN_TIMEOUT = float(os.getenv("A2F_DRAIN_TIMEOUT", "120"))
+COMMANDS = ("stats", "profile", "drain", "reload")
+
+
+async def send_control(url, header):
+    async with websockets.connect(url) as ws:
+        await ws.send(json.dumps(header))
+        return json.loads(await ws.recv())
+
+
+def get_json(url):
+    with urllib.request.urlopen(url, timeout=2) as resp:
+        return json.loads(resp.read())
+
+
+def wait_for_successor(http_url, old_pid, timeout):
+    """Polls until a process other than old_pid answers /ready with 200; returns its PID or None."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            pid = get_json(f"{http_url}/diagnostics").get("pid")
+            if pid != old_pid:
+                with urllib.request.urlopen(f"{http_url}/ready", timeout=2) as resp:
+                    if resp.status == 200:
+                        return pid
+        except (urllib.error.URLError, ConnectionError, OSError, ValueError):
+            pass  # refused or 503 while the old process drains and the new one starts
+        time.sleep(0.5)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=COMMANDS)
+    parser.add_argument("--host", default="127.0.0.1", help="grpc_client.py host (default loopback)")
+    parser.add_argument("--port", type=int, default=WS_PORT, help="grpc_client.py WebSocket port")
+    parser.add_argument("--token", default=os.getenv("A2F_CONTROL_TOKEN", ""),
+                        help="A2F_CONTROL_TOKEN, needed for privileged commands from other hosts")
+    parser.add_argument("--seconds", type=float, default=10, help="Profile length for 'profile'")
+    parser.add_argument("--wait", action="store_true", help="For drain/reload: wait until a new process is ready")
+    parser.add_argument("--timeout", type=float, default=DRAIN_TIMEOUT + 60,
+                        help="Seconds to wait with --wait (default A2F_DRAIN_TIMEOUT + 60)")
+    args = parser.parse_args()
+
+    header = {"control": args.command}
+    if args.command == "profile":
+        header["seconds"] = args.seconds
+    if args.token:
+        header["token"] = args.token
+    try:
+        reply = asyncio.run(send_control(f"ws://{args.host}:{args.port}", header))
+    except (OSError, websockets.exceptions.WebSocketException) as e:
+        print(f"[Control] Could not reach grpc_client.py at {args.host}:{args.port}: {e}")
+        return 1
+    print(json.dumps(reply, indent=2))
+    if reply.get("status") != "ok":
+        return 1
+
+    if args.wait and args.command in ("drain", "reload"):
+        print(f"[Control] Waiting for a new process to replace PID {reply.get('pid')}...")
+        pid = wait_for_successor(f"http://{args.host}:{args.port}", reply.get("pid"), args.timeout)
+        if pid is None:
+            print(f"[Control] No new process ready after {args.timeout:.0f}s.")
+            return 1
+        print(f"[Control] PID {pid} is ready.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
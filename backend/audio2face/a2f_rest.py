@@ -0,0 +1,233 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+A2F_REST_URL = os.getenv("A2F_REST_URL", "http://localhost:8011")
+A2F_REST_RETRIES = int(os.getenv("A2F_REST_RETRIES", "2"))
+
+
+class A2FRestError(Exception):
+    """Raised when an Audio2Face REST call fails or A2F reports a non-OK status."""
+
+
+class LatencyStats:
+    """Per-endpoint call latencies over a sliding window of recent calls."""
+
+    def __init__(self, window=512):
+        self.window = window
+        self._samples = {}
+        self._counts = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds, ok=True):
+        with self._lock:
+            if key not in self._samples:
+                self._samples[key] = deque(maxlen=self.window)
+                self._counts[key] = 0
+                self._errors[key] = 0
+            self._samples[key].append(seconds)
+            self._counts[key] += 1
+            if not ok:
+                self._errors[key] += 1
+
+    def mean(self, key):
+        """Mean latency in seconds for key over the window, or None if never called."""
+        with self._lock:
+            samples = self._samples.get(key)
+            return sum(samples) / len(samples) if samples else None
+
+    def snapshot(self):
+        """{endpoint: {count, errors, mean_ms, p50_ms, p95_ms, max_ms}}"""
+        with self._lock:
+            items = [(k, sorted(v), self._counts[k], self._errors[k]) for k, v in self._samples.items()]
+        out = {}
+        for key, samples, count, errors in items:
+            n = len(samples)
+            out[key] = {
+                "count": count,
+                "errors": errors,
+                "mean_ms": sum(samples) / n * 1000,
+                "p50_ms": samples[n // 2] * 1000,
+                "p95_ms": samples[min(n - 1, int(n * 0.95))] * 1000,
+                "max_ms": samples[-1] * 1000,
+            }
+        return out
+
+
+class A2FRestClient:
+    """
+    Client for the Audio2Face headless REST API.
+
+    One pooled keep-alive session shared by every caller (safe across threads).
+    Connection errors and 5xx responses are retried with jittered exponential
+    backoff; read timeouts are not, since A2F may still be acting on the call.
+    Non-idempotent calls (USD/Load, Play) are only retried when the connection
+    was never made. Every attempt's latency is recorded in self.metrics.
+    submit() runs any method on a small executor and returns a Future, which is
+    how callers overlap a call (e.g. the next SetTrack) with work in progress.
+    """
+
+    def __init__(self, base_url=A2F_REST_URL, pool_size=8, timeout=5, retries=A2F_REST_RETRIES,
+                 backoff=0.05, max_backoff=1.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.metrics = LatencyStats()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"accept": "application/json"})
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="a2f-rest")
+
+    def request(self, method, path, payload=None, timeout=None, retries=None, idempotent=True):
+        """Issues one call and returns the decoded JSON body (or text if the body is not JSON)."""
+        retries = self.retries if retries is None else retries
+        delay = self.backoff
+        for attempt in range(retries + 1):
+            t0 = time.perf_counter()
+            try:
+                resp = self.session.request(method, f"{self.base_url}{path}", json=payload,
+                                            timeout=timeout or self.timeout)
+                if resp.status_code >= 500 and idempotent and attempt < retries:
+                    raise requests.HTTPError(f"{resp.status_code} Server Error", response=resp)
+                resp.raise_for_status()
+                self.metrics.record(path, time.perf_counter() - t0)
+                break
+            except requests.RequestException as e:
+                self.metrics.record(path, time.perf_counter() - t0, ok=False)
+                if attempt == retries or not self._retryable(e, idempotent):
+                    raise A2FRestError(f"{method} {path} failed: {e}") from e
+                time.sleep(delay * random.uniform(0.5, 1.5))
+                delay = min(delay * 2, self.max_backoff)
+        try:
+            body = resp.json()
+        except ValueError:
+            return resp.text
+        if isinstance(body, dict) and body.get("status") not in (None, "OK"):
+            raise A2FRestError(f"{method} {path} returned {body.get('status')}: {body.get('message')}")
+        return body
+
+    @staticmethod
+    def _retryable(error, idempotent):
+        if isinstance(error, requests.ConnectTimeout) or (
+                isinstance(error, requests.ConnectionError)
+                and isinstance(getattr(error.args[0] if error.args else None, "reason", None), NewConnectionError)):
+            return True  # never reached A2F (timed out or refused), safe to repeat anything
+        if not idempotent:
+            return False
+        if isinstance(error, requests.HTTPError):
+            return error.response is not None and error.response.status_code >= 500
+        return isinstance(error, requests.ConnectionError)
+
+    def post(self, path, payload=None, timeout=None, retries=None, idempotent=True):
+        return self.request("POST", path, payload, timeout, retries, idempotent)
+
+    def get(self, path, timeout=None, retries=None):
+        return self.request("GET", path, None, timeout, retries)
+
+    def submit(self, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) (usually a bound method of this client) in the background."""
+        return self._executor.submit(fn, *args, **kwargs)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+    # --- Service -------------------------------------------------------------
+
+    def status(self, timeout=None):
+        """Returns True if the REST server answers /status. Never retried: callers poll it."""
+        try:
+            self.get("/status", timeout=timeout, retries=0)
+            return True
+        except A2FRestError:
+            return False
+
+    # --- USD / instances -----------------------------------------------------
+
+    def load_usd(self, file_name, timeout=60):
+        # A slow load must not be issued again on top of itself
+        return self.post("/A2F/USD/Load", {"file_name": file_name}, timeout=timeout, idempotent=False)
+
+    def get_instances(self):
+        return self.get("/A2F/GetInstances")
+
+    def has_instance(self, instance):
+        """True if the loaded stage already contains the given A2F instance path."""
+        try:
+            return instance in str(self.get_instances())
+        except A2FRestError:
+            return False
+
+    # --- Player --------------------------------------------------------------
+
+    def set_root_path(self, a2f_player, dir_path):
+        return self.post("/A2F/Player/SetRootPath", {"a2f_player": a2f_player, "dir_path": dir_path})
+
+    def get_tracks(self, a2f_player):
+        return self.post("/A2F/Player/GetTracks", {"a2f_player": a2f_player})
+
+    def set_looping(self, a2f_player, loop_audio):
+        return self.post("/A2F/Player/SetLooping", {"a2f_player": a2f_player, "loop_audio": loop_audio})
+
+    def set_track(self, a2f_player, file_name, time_range=(0, -1)):
+        return self.post("/A2F/Player/SetTrack",
+                         {"a2f_player": a2f_player, "file_name": file_name, "time_range": list(time_range)})
+
+    def play(self, a2f_player, file_name=None):
+        payload = {"a2f_player": a2f_player}
+        if file_name:
+            payload["file_name"] = file_name
+        return self.post("/A2F/Player/Play", payload, idempotent=False)  # a repeat would play twice
+
+    def pause(self, a2f_player):
+        return self.post("/A2F/Player/Pause", {"a2f_player": a2f_player})
+
+    # --- A2E / Exporter ------------------------------------------------------
+
+    def set_emotion(self, a2f_instance, emotion):
+        return self.post("/A2F/A2E/SetEmotion", {"a2f_instance": a2f_instance, "emotion": list(emotion)})
+
+    def activate_stream_livelink(self, node_path, value=True):
+        return self.post("/A2F/Exporter/ActivateStreamLivelink", {"node_path": node_path, "value": value})
+
+
+class AsyncA2FRestClient:
+    """
+    asyncio front end to A2FRestClient: every public method becomes awaitable and
+    runs on the client's executor, so the event loop never blocks on HTTP.
+
+        client = AsyncA2FRestClient()
+        await client.set_track(player, "message_3.wav")
+    """
+
+    def __init__(self, client=None, **kwargs):
+        self.client = client or A2FRestClient(**kwargs)
+
+    @property
+    def metrics(self):
+        return self.client.metrics
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if name.startswith("_") or not callable(attr) or name in ("submit",):
+            return attr
+
+        async def call(*args, **kwargs):
+            return await asyncio.wrap_future(self.client.submit(attr, *args, **kwargs))
+        return call
+
+    def close(self):
+        self.client.close()
@@ -0,0 +1,47 @@
+import os
+import time
+
+import numpy as np
+
+import audio2face_pb2
+
+STREAM_CHUNK_SECONDS = float(os.getenv("A2F_STREAM_CHUNK_SECONDS", "0.1"))  # audio per message
+STREAM_SEND_INTERVAL = float(os.getenv("A2F_STREAM_SEND_INTERVAL", "0.04"))  # wall time per chunk
+
+
+def stream_requests(instance, samplerate, segments, block_until_playback_is_finished=True,
+                    chunk_seconds=STREAM_CHUNK_SECONDS, send_interval=STREAM_SEND_INTERVAL,
+                    should_stop=None, on_segment=None):
+    """
+    Yields the PushAudioStream request sequence for one or more mono float32 segments
+    at `samplerate`, back to back in a single stream, so A2F plays them without gaps.
+
+    Pacing follows a deadline computed from the samples already sent (chunk_seconds of
+    audio per send_interval of wall time), so time spent building messages or producing
+    the next segment does not accumulate as drift the way a fixed sleep per chunk does.
+    should_stop() is polled before each chunk; on_segment(n, segment) fires as each
+    segment starts.
+    """
+    start_marker = audio2face_pb2.PushAudioRequestStart(
+        instance_name=instance,
+        samplerate=int(samplerate),
+        block_until_playback_is_finished=block_until_playback_is_finished
+    )
+    yield audio2face_pb2.PushAudioStreamRequest(start_marker=start_marker)
+
+    chunk_size = max(1, int(samplerate * chunk_seconds))
+    wall_per_sample = send_interval / (samplerate * chunk_seconds)
+    start = time.monotonic()
+    samples_sent = 0
+    for n, segment in enumerate(segments):
+        if on_segment is not None:
+            on_segment(n, segment)
+        for i in range(0, len(segment), chunk_size):
+            if should_stop is not None and should_stop():
+                return
+            delay = start + samples_sent * wall_per_sample - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            chunk = segment[i:i + chunk_size]
+            yield audio2face_pb2.PushAudioStreamRequest(audio_data=chunk.astype(np.float32, copy=False).tobytes())
+            samples_sent += len(chunk)
@@ -0,0 +1,105 @@
+import io
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import soundfile as sf
+
+# Formats accepted in the stream header's "format" field.
+# libsndfile >= 1.1 (bundled with soundfile 0.12) decodes MP3 and Ogg/Opus.
+SUPPORTED_FORMATS = {"wav", "mp3", "flac", "ogg", "opus"}
+COMPRESSED_FORMATS = {"mp3", "flac", "ogg", "opus"}
+
+DECODE_WORKERS = int(os.getenv("A2F_DECODE_WORKERS", "2"))
+
+_decode_pool = None
+
+
+def get_decode_pool():
+    """Returns the shared decode pool, creating it on first use."""
+    global _decode_pool
+    if _decode_pool is None:
+        # soundfile calls into libsndfile through cffi, which releases the GIL,
+        # so threads decode in parallel without pickling the PCM back from a process.
+        _decode_pool = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix="decode")
+    return _decode_pool
+
+
+def shutdown_decode_pool():
+    global _decode_pool
+    if _decode_pool is not None:
+        _decode_pool.shutdown(wait=False)
+        _decode_pool = None
+
+
+def normalize_format(fmt):
+    """Maps a header format string ("mp3", "audio/mpeg", ".flac", ...) to a key of SUPPORTED_FORMATS."""
+    if not fmt:
+        return "wav"
+    fmt = str(fmt).strip().lower()
+    if "/" in fmt:  # MIME type
+        fmt = fmt.split("/", 1)[1]
+    fmt = fmt.lstrip(".")
+    if fmt in ("mpeg", "mpga"):
+        fmt = "mp3"
+    elif fmt in ("x-wav", "wave", "vnd.wave"):
+        fmt = "wav"
+    elif fmt == "x-flac":
+        fmt = "flac"
+    if fmt not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported audio format '{fmt}'")
+    return fmt
+
+
+def decode_audio(buffer, fmt="wav"):
+    """
+    Decodes an in-memory audio file to float32 PCM.
+    Returns (audio_data, samplerate); audio_data is (frames,) or (frames, channels).
+    """
+    fmt = normalize_format(fmt)
+    audio_io = io.BytesIO(buffer)
+    # libsndfile sniffs the container itself; fmt only gates what we accept.
+    with sf.SoundFile(audio_io, 'r') as sf_file:
+        audio_data = sf_file.read(dtype="float32")
+        samplerate = sf_file.samplerate
+    return audio_data, samplerate
+
+
+async def decode_audio_async(buffer, fmt="wav"):
+    """Runs decode_audio on the shared decode pool so the event loop keeps serving sockets."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_decode_pool(), decode_audio, buffer, fmt)
+
+
+def to_mono(audio_data):
+    """Averages channels down to mono (Audio2Face only accepts a single channel)."""
+    if audio_data.ndim > 1:
+        return np.average(audio_data, axis=1).astype(np.float32, copy=False)
+    return audio_data
+
+
+def resample(audio_data, samplerate, target_samplerate):
+    """
+    Resamples mono float32 PCM by linear interpolation.
+    Good enough for speech driving Audio2Face; returns the input unchanged if rates match.
+    """
+    if not target_samplerate or samplerate == target_samplerate or len(audio_data) == 0:
+        return audio_data
+    duration = len(audio_data) / samplerate
+    n_out = int(round(duration * target_samplerate))
+    src_t = np.arange(len(audio_data), dtype=np.float64) / samplerate
+    dst_t = np.arange(n_out, dtype=np.float64) / target_samplerate
+    return np.interp(dst_t, src_t, audio_data).astype(np.float32)
+
+
+def load_audio_file(path, target_samplerate=None):
+    """Reads an audio file from disk and returns (mono float32 PCM, samplerate), resampled if asked."""
+    normalize_format(os.path.splitext(path)[1] or "wav")
+    with sf.SoundFile(path, 'r') as sf_file:
+        audio_data = to_mono(sf_file.read(dtype="float32"))
+        samplerate = sf_file.samplerate
+    if target_samplerate:
+        audio_data = resample(audio_data, samplerate, target_samplerate)
+        samplerate = target_samplerate
+    return audio_data, samplerate
@@ -0,0 +1,154 @@
+"""
+Loudness conditioning for incoming TTS audio before it reaches Audio2Face.
+
+TTS voices differ by 10 dB or more in level, and A2F's mouth amplitude follows the
+input level, so each utterance is brought to a common RMS here:
+downmix -> DC offset removal -> gain normalisation -> peak limiting.
+
+All per-utterance scalars (the 1/channels downmix weight, the DC offset, the
+normalisation gain and the peak ceiling) are worked out from a few reductions and
+folded into a single affine transform, applied in place. Multi-channel input is
+downmixed straight into a pooled float32 buffer with one matrix-vector product, so
+conditioning allocates nothing per utterance once the pool is warm.
+
+Settings (environment):
+    A2F_CONDITION=1                     0 turns conditioning off (plain downmix only)
+    A2F_CONDITION_TARGET_DBFS=-20       RMS level to normalise to
+    A2F_CONDITION_MAX_GAIN_DB=18        cap on boost, so near-silence and noise are not blown up
+    A2F_CONDITION_CEILING_DBFS=-1       peak ceiling; the gain is lowered so no sample exceeds it
+    A2F_CONDITION_DC=1                  0 keeps the DC offset
+"""
+import os
+import threading
+
+import numpy as np
+
+CONDITION_ENABLED = os.getenv("A2F_CONDITION", "1") != "0"
+TARGET_DBFS = float(os.getenv("A2F_CONDITION_TARGET_DBFS", "-20"))
+MAX_GAIN_DB = float(os.getenv("A2F_CONDITION_MAX_GAIN_DB", "18"))
+CEILING_DBFS = float(os.getenv("A2F_CONDITION_CEILING_DBFS", "-1"))
+REMOVE_DC = os.getenv("A2F_CONDITION_DC", "1") != "0"
+POOL_BUFFERS = int(os.getenv("A2F_CONDITION_POOL_BUFFERS", "4"))
+
+SILENCE_RMS = 1e-5  # about -100 dBFS; below this the input is treated as silence and left alone
+
+
+def db_to_linear(db):
+    return 10.0 ** (db / 20.0)
+
+
+def linear_to_db(value):
+    return float(20.0 * np.log10(value)) if value > 0 else float("-inf")
+
+
+class BufferPool:
+    """
+    Keeps up to `max_buffers` float32 buffers for reuse. acquire(n) hands out a
+    length-n view of the smallest free buffer that fits (allocating a new one only
+    when none does); release() takes the view back once its audio has been streamed.
+    """
+
+    def __init__(self, max_buffers=POOL_BUFFERS):
+        self.max_buffers = max_buffers
+        self._free = []
+        self._issued = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, n):
+        with self._lock:
+            fits = [b for b in self._free if len(b) >= n]
+            if fits:
+                base = min(fits, key=len)
+                self._free.remove(base)
+            else:
+                # Round up so slightly longer utterances still fit next time
+                base = np.empty(max(n, 1 << max(0, n - 1).bit_length()), dtype=np.float32)
+            view = base[:n]
+            self._issued[id(view)] = base
+            return view
+
+    def release(self, view):
+        """Returns a buffer from acquire() to the pool; arrays the pool did not issue are ignored."""
+        with self._lock:
+            base = self._issued.pop(id(view), None)
+            if base is None:
+                return
+            self._free.append(base)
+            if len(self._free) > self.max_buffers:
+                self._free.remove(min(self._free, key=len))
+
+
+class AudioConditioner:
+    def __init__(self, target_dbfs=TARGET_DBFS, max_gain_db=MAX_GAIN_DB, ceiling_dbfs=CEILING_DBFS,
+                 remove_dc=REMOVE_DC, enabled=CONDITION_ENABLED, pool=None):
+        self.target_rms = db_to_linear(target_dbfs)
+        self.max_gain = db_to_linear(max_gain_db)
+        self.ceiling = db_to_linear(ceiling_dbfs)
+        self.remove_dc = remove_dc
+        self.enabled = enabled
+        self.pool = pool if pool is not None else BufferPool()
+
+    def process(self, audio_data):
+        """
+        Conditions decoded float32 PCM, (frames,) or (frames, channels), and returns
+        (mono float32, stats). Mono input is modified in place; multi-channel input is
+        downmixed into a pooled buffer, to be handed back with release() when done.
+        """
+        if audio_data.ndim > 1 and audio_data.shape[1] == 1:
+            audio_data = audio_data[:, 0]
+        channels = 1 if audio_data.ndim == 1 else audio_data.shape[1]
+        n = len(audio_data)
+
+        if channels == 1:
+            if audio_data.dtype != np.float32 or not audio_data.flags.writeable:
+                audio_data = np.array(audio_data, dtype=np.float32)
+            out = audio_data
+            weight = 1.0
+        else:
+            # Sum the channels with one sgemv; the 1/channels weight is folded into the gain below
+            out = self.pool.acquire(n)
+            np.dot(np.ascontiguousarray(audio_data, dtype=np.float32), np.ones(channels, dtype=np.float32), out=out)
+            weight = 1.0 / channels
+
+        if not self.enabled or n == 0:
+            if weight != 1.0:
+                out *= np.float32(weight)
+            return out, {"channels": channels, "conditioned": False}
+
+        # Reductions on the summed signal; everything after them is scalar math
+        total = float(np.add.reduce(out, dtype=np.float64))
+        sum_sq = float(np.dot(out, out))
+        hi = float(out.max())
+        lo = float(out.min())
+
+        offset = total / n if self.remove_dc else 0.0
+        # Mean square about the offset, from the raw sums instead of another pass
+        rms = weight * max(0.0, sum_sq / n - 2 * offset * total / n + offset * offset) ** 0.5
+        peak = weight * max(hi - offset, offset - lo)
+
+        if rms < SILENCE_RMS:
+            gain = 1.0
+        else:
+            gain = min(self.target_rms / rms, self.max_gain)
+        limited = peak * gain > self.ceiling
+        if limited:
+            gain = self.ceiling / peak
+
+        # y = (x - offset) * weight * gain, in place: one multiply and one subtract
+        scale = weight * gain
+        if scale != 1.0:
+            out *= np.float32(scale)
+        if offset != 0.0:
+            out -= np.float32(offset * scale)
+
+        return out, {
+            "channels": channels,
+            "conditioned": True,
+            "rms_in_db": round(linear_to_db(rms), 1),
+            "gain_db": round(linear_to_db(gain), 1),
+            "dc_offset": round(offset * weight, 5),
+            "peak_limited": limited,
+        }
+
+    def release(self, audio_data):
+        self.pool.release(audio_data)
@@ -0,0 +1,211 @@
+import bisect
+import os
+import re
+import threading
+import time
+
+from audio_meta_cache import get_meta_cache
+
+MESSAGE_RE = re.compile(r"message_(\d+)\.wav$")
+
+# Retention: keep at most this many messages per directory (0 = unlimited)
+INDEX_MAX_FILES = int(os.environ.get("A2F_INDEX_MAX_FILES", "0"))
+# Retention: delete messages older than this many seconds (0 = keep forever)
+INDEX_MAX_AGE = float(os.environ.get("A2F_INDEX_MAX_AGE", "0"))
+# How often the watcher checks indexed directories for outside changes (seconds)
+INDEX_POLL_INTERVAL = float(os.environ.get("A2F_INDEX_POLL_INTERVAL", "1.0"))
+
+
+def message_name(index):
+    return f"message_{index}.wav"
+
+
+class AudioEntry:
+    __slots__ = ("index", "path", "size", "mtime", "meta")
+
+    def __init__(self, index, path, size, mtime, meta):
+        self.index = index
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.meta = meta  # format metadata from the AudioMetaCache, or None if unreadable
+
+    @property
+    def duration(self):
+        return self.meta["duration"] if self.meta else None
+
+    @property
+    def file_name(self):
+        return os.path.basename(self.path)
+
+    def to_dict(self):
+        return {"index": self.index, "file": self.file_name, "size": self.size, "duration": self.duration,
+                "samplerate": self.meta and self.meta["samplerate"], "channels": self.meta and self.meta["channels"]}
+
+
+class AudioIndex:
+    """
+    In-memory, sorted index of the message_N.wav files in one directory.
+
+    Uploads call add() directly; the watcher calls sync() when the directory's
+    mtime moves, so files dropped in by other tools are picked up too.
+    Range queries are a bisect over the sorted index list.
+    """
+
+    def __init__(self, dir_path, max_files=INDEX_MAX_FILES, max_age=INDEX_MAX_AGE, meta_cache=None):
+        self.dir_path = dir_path
+        self.meta_cache = meta_cache or get_meta_cache()
+        self.max_files = max_files
+        self.max_age = max_age
+        self._indices = []   # sorted message indices
+        self._entries = {}   # index -> AudioEntry
+        self._lock = threading.RLock()
+        self._dir_mtime = None
+        self.sync()
+
+    def __len__(self):
+        return len(self._indices)
+
+    def _make_entry(self, index, path, st=None, meta=None):
+        st = st or os.stat(path)
+        if meta is None:
+            try:
+                meta = self.meta_cache.get_or_read(path, st)
+            except Exception as e:
+                print(f"[AudioIndex] [WARN] Cannot read {path}: {e}")
+        return AudioEntry(index, path, st.st_size, st.st_mtime, meta)
+
+    def _insert(self, entry):
+        if entry.index not in self._entries:
+            bisect.insort(self._indices, entry.index)
+        self._entries[entry.index] = entry
+
+    def _remove(self, index):
+        entry = self._entries.pop(index, None)
+        if entry is not None:
+            del self._indices[bisect.bisect_left(self._indices, index)]
+            self.meta_cache.discard(entry.path)
+
+    def add(self, index, path=None, meta=None):
+        """
+        Indexes (or re-indexes) a message that was just written. Returns its entry.
+        Pass meta if the writer already knows the format, to skip reading the header back.
+        """
+        index = int(index)
+        path = path or os.path.join(self.dir_path, message_name(index))
+        st = os.stat(path)
+        if meta is not None:
+            meta = self.meta_cache.put(path, meta, st)
+        entry = self._make_entry(index, path, st, meta)
+        with self._lock:
+            self._insert(entry)
+        self.apply_retention()
+        return entry
+
+    def get(self, index):
+        return self._entries.get(int(index))
+
+    def require_duration(self, entry):
+        """
+        entry.duration, re-reading the header once if it could not be read at indexing
+        time (e.g. the file was still being written). Raises if it is still unreadable.
+        """
+        if entry.meta is None:
+            entry.meta = self.meta_cache.get_or_read(entry.path)
+        return entry.duration
+
+    def range_from(self, start_index):
+        """Entries with index >= start_index, in order."""
+        with self._lock:
+            pos = bisect.bisect_left(self._indices, int(start_index))
+            return [self._entries[i] for i in self._indices[pos:]]
+
+    def sync(self, force=False):
+        """Reconciles the index with the directory. Cheap no-op unless the directory mtime changed."""
+        try:
+            dir_mtime = os.stat(self.dir_path).st_mtime_ns
+        except FileNotFoundError:
+            with self._lock:
+                self._indices, self._entries = [], {}
+            return False
+        if not force and dir_mtime == self._dir_mtime:
+            return False
+
+        seen = {}
+        with os.scandir(self.dir_path) as it:
+            for de in it:
+                m = MESSAGE_RE.match(de.name)
+                if m:
+                    seen[int(m.group(1))] = de
+        with self._lock:
+            for index in [i for i in self._indices if i not in seen]:
+                self._remove(index)
+            for index, de in seen.items():
+                st = de.stat()
+                old = self._entries.get(index)
+                if old is None or old.size != st.st_size or old.mtime != st.st_mtime:
+                    self._insert(self._make_entry(index, de.path, st))
+            self._dir_mtime = dir_mtime
+        self.apply_retention()
+        return True
+
+    def apply_retention(self):
+        """Deletes the oldest messages beyond max_files and any older than max_age seconds."""
+        if not self.max_files and not self.max_age:
+            return []
+        with self._lock:
+            doomed = set()
+            if self.max_files and len(self._indices) > self.max_files:
+                doomed.update(self._indices[:len(self._indices) - self.max_files])
+            if self.max_age:
+                cutoff = time.time() - self.max_age
+                doomed.update(i for i, e in self._entries.items() if e.mtime < cutoff)
+            removed = [self._entries[i] for i in sorted(doomed)]
+            for entry in removed:
+                self._remove(entry.index)
+        for entry in removed:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"[AudioIndex] [WARN] Retention could not delete {entry.path}: {e}")
+        return removed
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+_watcher = None
+
+
+def get_index(dir_path):
+    """Returns the shared index for dir_path, building it (and starting the watcher) on first use."""
+    key = os.path.abspath(dir_path)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = AudioIndex(dir_path)
+        _ensure_watcher()
+        return index
+
+
+def _ensure_watcher():
+    global _watcher
+    if INDEX_POLL_INTERVAL > 0 and (_watcher is None or not _watcher.is_alive()):
+        _watcher = threading.Thread(target=_watch, name="audio-index-watcher", daemon=True)
+        _watcher.start()
+
+
+def _watch():
+    # Polling the directory mtime is one stat per directory per interval and works the
+    # same on Windows and POSIX, without an extra file-watching dependency.
+    while True:
+        time.sleep(INDEX_POLL_INTERVAL)
+        with _indexes_lock:
+            indexes = list(_indexes.values())
+        for index in indexes:
+            try:
+                index.sync()
+            except Exception as e:
+                print(f"[AudioIndex] [WARN] Sync of {index.dir_path} failed: {e}")
+        get_meta_cache().flush()
@@ -0,0 +1,164 @@
+import atexit
+import json
+import os
+import struct
+import threading
+
+import soundfile as sf
+
+# Where durations and formats survive restarts; one JSON file for all indexed directories
+META_CACHE_PATH = os.environ.get("A2F_META_CACHE",
+                                 os.path.join(os.path.dirname(os.path.abspath(__file__)), ".audio_meta_cache.json"))
+
+
+def read_metadata(path):
+    """Opens the file header once and returns its format metadata."""
+    with sf.SoundFile(path) as f:
+        return {
+            "duration": len(f) / f.samplerate,
+            "frames": len(f),
+            "samplerate": f.samplerate,
+            "channels": f.channels,
+            "format": f.format,
+            "subtype": f.subtype,
+        }
+
+
+# (format tag, bits per sample) -> soundfile subtype name
+_WAV_SUBTYPES = {
+    (1, 8): "PCM_U8", (1, 16): "PCM_16", (1, 24): "PCM_24", (1, 32): "PCM_32",
+    (3, 32): "FLOAT", (3, 64): "DOUBLE",
+}
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def parse_wav_header(head, file_size):
+    """
+    Derives read_metadata()'s fields from the leading bytes of a RIFF/WAVE file,
+    so writers can extract metadata from the bytes they are already streaming.
+    Returns None if head is not a plain PCM/float WAV or is too short to contain
+    the fmt and data chunk headers; callers then fall back to read_metadata().
+    """
+    if len(head) < 12 or head[:4] != b"RIFF" or head[8:12] != b"WAVE":
+        return None
+    fmt = None
+    pos = 12
+    while pos + 8 <= len(head):
+        chunk_id, chunk_size = struct.unpack_from("<4sI", head, pos)
+        body = pos + 8
+        if chunk_id == b"fmt ":
+            if body + 16 > len(head):
+                return None
+            tag, channels, samplerate, _, block_align, bits = struct.unpack_from("<HHIIHH", head, body)
+            if tag == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 40 and body + 26 <= len(head):
+                tag = struct.unpack_from("<H", head, body + 24)[0]  # first two bytes of the subformat GUID
+                container = "WAVEX"
+            else:
+                container = "WAV"
+            fmt = (tag, channels, samplerate, block_align, bits, container)
+        elif chunk_id == b"data":
+            if fmt is None:
+                return None
+            tag, channels, samplerate, block_align, bits, container = fmt
+            subtype = _WAV_SUBTYPES.get((tag, bits))
+            if subtype is None or not samplerate or not block_align:
+                return None
+            # Streamed WAVs may leave the size as 0 or 0xFFFFFFFF; trust the file size then
+            available = file_size - body
+            data_size = chunk_size if 0 < chunk_size <= available else available
+            frames = data_size // block_align
+            return {
+                "duration": frames / samplerate,
+                "frames": frames,
+                "samplerate": samplerate,
+                "channels": channels,
+                "format": container,
+                "subtype": subtype,
+            }
+        pos = body + chunk_size + (chunk_size & 1)  # chunks are word aligned
+    return None
+
+
+class AudioMetaCache:
+    """
+    Audio metadata keyed by (path, mtime, size).
+
+    A hit requires the file's current mtime and size to match, so a rewritten file
+    is re-read; message files are immutable after upload, so in practice every file
+    is opened once. Changes are written back with flush() (atomic replace).
+    """
+
+    def __init__(self, path=META_CACHE_PATH):
+        self.path = path
+        self._entries = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            self._entries = {}
+        except (OSError, ValueError) as e:
+            print(f"[MetaCache] [WARN] Ignoring unreadable cache {self.path}: {e}")
+            self._entries = {}
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = json.dumps(self._entries, separators=(",", ":"))
+            self._dirty = False
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(snapshot)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[MetaCache] [WARN] Could not write {self.path}: {e}")
+            with self._lock:
+                self._dirty = True
+
+    def get(self, path, st=None):
+        """Returns cached metadata if the file is unchanged since it was cached, else None."""
+        key = os.path.abspath(path)
+        st = st or os.stat(path)
+        meta = self._entries.get(key)
+        if meta and meta["mtime_ns"] == st.st_mtime_ns and meta["size"] == st.st_size:
+            return meta
+        return None
+
+    def put(self, path, meta, st=None):
+        key = os.path.abspath(path)
+        st = st or os.stat(path)
+        meta = dict(meta, mtime_ns=st.st_mtime_ns, size=st.st_size)
+        with self._lock:
+            self._entries[key] = meta
+            self._dirty = True
+        return meta
+
+    def get_or_read(self, path, st=None):
+        """Cached metadata, reading the header only on a miss."""
+        st = st or os.stat(path)
+        return self.get(path, st) or self.put(path, read_metadata(path), st)
+
+    def discard(self, path):
+        with self._lock:
+            if self._entries.pop(os.path.abspath(path), None) is not None:
+                self._dirty = True
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_meta_cache():
+    """Returns the process-wide cache, loading it from disk on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AudioMetaCache()
+            atexit.register(_cache.flush)
+        return _cache
@@ -0,0 +1,77 @@
+import os
+import shutil
+import uuid
+
+from audio_meta_cache import parse_wav_header
+
+COPY_CHUNK_SIZE = 256 * 1024
+# Enough to hold the fmt/data chunk headers of any WAV we produce, plus LIST/fact chunks
+HEADER_PEEK_SIZE = 64 * 1024
+
+
+def _temp_path(dst_path):
+    # Same directory so os.replace is an atomic rename; the suffix keeps the
+    # half-written file out of the message_N.wav pattern the index watches.
+    return f"{dst_path}.{uuid.uuid4().hex}.part"
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _commit(tmp_path, dst_path):
+    try:
+        os.replace(tmp_path, dst_path)
+    except BaseException:
+        _remove_quietly(tmp_path)
+        raise
+
+
+def save_stream(stream, dst_path, chunk_size=COPY_CHUNK_SIZE):
+    """
+    Writes a file-like stream to dst_path in bounded chunks and renames it into place.
+    The WAV header is parsed from the first bytes on the way through.
+    Returns the file's metadata (see audio_meta_cache.read_metadata) or None if it
+    could not be derived from the header.
+    """
+    tmp_path = _temp_path(dst_path)
+    head = bytearray()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as dst:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                if len(head) < HEADER_PEEK_SIZE:
+                    head += chunk[:HEADER_PEEK_SIZE - len(head)]
+                dst.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        _remove_quietly(tmp_path)
+        raise
+    _commit(tmp_path, dst_path)
+    return parse_wav_header(bytes(head), size)
+
+
+def copy_file(src_path, dst_path):
+    """
+    Copies src_path to dst_path through a temp file and atomic rename.
+    shutil.copyfile uses the kernel's copy (sendfile on Linux, fcopyfile on macOS)
+    where available, so the audio never passes through Python; only the header is
+    read, for the returned metadata (None if it is not a WAV we can parse).
+    """
+    with open(src_path, "rb") as src:
+        head = src.read(HEADER_PEEK_SIZE)
+        size = os.fstat(src.fileno()).st_size
+    tmp_path = _temp_path(dst_path)
+    try:
+        shutil.copyfile(src_path, tmp_path)
+    except BaseException:
+        _remove_quietly(tmp_path)
+        raise
+    _commit(tmp_path, dst_path)
+    return parse_wav_header(head, size)
@@ -0,0 +1,192 @@
+"""
+Offline batch mode: pushes whole WAV files to Audio2Face with the unary PushAudio RPC.
+
+Unlike grpc_client.py, nothing is paced to real time. Files are spread over the
+configured A2F targets, one call in flight per player: a second PushAudio to the
+same player would replace the track it is rendering, so parallelism comes from
+adding targets. Each file is decoded, downmixed and resampled exactly once, right
+before it is pushed.
+
+    python batch_push.py renders/ --target localhost:50051=/World/audio2face/Player
+    python batch_push.py manifest.txt --target localhost:50051=/World/audio2face/Player \
+        --target localhost:50052=/World/audio2face/Player --report report.json
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+
+import grpc
+import numpy as np
+from dotenv import load_dotenv
+
+import audio2face_pb2
+import audio2face_pb2_grpc
+from audio_codec import SUPPORTED_FORMATS, load_audio_file
+
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
+A2F_GRPC_URL = os.getenv("A2F_GRPC_URL", "localhost:50051")
+INSTANCE_NAME = os.getenv("INSTANCE_NAME", "/World/audio2face/PlayerStreaming")
+# Comma-separated "url=instance" pairs, e.g. "localhost:50051=/World/audio2face/Player,localhost:50052=/World/audio2face/Player"
+A2F_BATCH_TARGETS = os.getenv("A2F_BATCH_TARGETS", "")
+
+
+def parse_target(spec):
+    """Parses "url=instance" (or just "url") into a (url, instance) tuple."""
+    url, sep, instance = spec.strip().partition("=")
+    return url, (instance if sep else INSTANCE_NAME)
+
+
+def default_targets():
+    if A2F_BATCH_TARGETS.strip():
+        return [parse_target(t) for t in A2F_BATCH_TARGETS.split(",") if t.strip()]
+    return [(A2F_GRPC_URL, INSTANCE_NAME)]
+
+
+def collect_files(source):
+    """
+    Returns the audio files to push, in order.
+    source is a directory (all supported audio files, sorted by name), a manifest
+    (.txt with one path per line, or .json list of paths), or a single audio file.
+    Relative manifest entries resolve against the manifest's directory.
+    """
+    if os.path.isdir(source):
+        return [os.path.join(source, f) for f in sorted(os.listdir(source))
+                if os.path.splitext(f)[1].lstrip(".").lower() in SUPPORTED_FORMATS]
+
+    ext = os.path.splitext(source)[1].lower()
+    if ext in (".txt", ".json"):
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source, "r", encoding="utf-8") as f:
+            if ext == ".json":
+                entries = json.load(f)
+            else:
+                entries = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+        return [e if os.path.isabs(e) else os.path.join(base, e) for e in entries]
+
+    return [source]
+
+
+def push_file(stub, instance, path, target_samplerate, block_until_playback_is_finished):
+    """Preprocesses one file and pushes it with a single PushAudio call. Returns a result dict."""
+    result = {"file": path, "instance": instance, "success": False}
+    t0 = time.perf_counter()
+    try:
+        audio_data, samplerate = load_audio_file(path, target_samplerate)
+    except Exception as e:
+        result["message"] = f"Preprocess failed: {e}"
+        return result
+    t1 = time.perf_counter()
+    result["audio_seconds"] = len(audio_data) / samplerate
+    result["preprocess_ms"] = (t1 - t0) * 1000
+
+    request = audio2face_pb2.PushAudioRequest(
+        instance_name=instance,
+        samplerate=int(samplerate),
+        audio_data=audio_data.astype(np.float32, copy=False).tobytes(),
+        block_until_playback_is_finished=block_until_playback_is_finished,
+    )
+    try:
+        response = stub.PushAudio(request)
+        result["success"] = response.success
+        result["message"] = response.message
+    except grpc.RpcError as e:
+        result["message"] = f"PushAudio failed: {e.code().name}: {e.details()}"
+    result["push_ms"] = (time.perf_counter() - t1) * 1000
+    return result
+
+
+def run_batch(files, targets=None, target_samplerate=16000, block_until_playback_is_finished=True, verbose=True):
+    """
+    Pushes files across targets with one in-flight call per player; targets naming the
+    same url and instance are one player. Returns {"results": [...], "summary": {...}},
+    results in input order.
+    """
+    targets = list(dict.fromkeys(targets or default_targets()))
+    work = queue.Queue()
+    for i, path in enumerate(files):
+        work.put((i, path))
+    results = [None] * len(files)
+
+    channels = [grpc.insecure_channel(url) for url, _ in targets]
+
+    def worker(target_index):
+        url, instance = targets[target_index]
+        stub = audio2face_pb2_grpc.Audio2FaceStub(channels[target_index])
+        while True:
+            try:
+                i, path = work.get_nowait()
+            except queue.Empty:
+                return
+            result = push_file(stub, instance, path, target_samplerate, block_until_playback_is_finished)
+            result["target"] = url
+            results[i] = result
+            if verbose:
+                status = "OK  " if result["success"] else "FAIL"
+                print(f"[Batch] {status} {os.path.basename(path)} -> {url}{instance} "
+                      f"({result.get('audio_seconds', 0):.2f}s audio, {result.get('push_ms', 0):.0f} ms push) {result.get('message', '')}")
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(t,), daemon=True) for t in range(len(targets))]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        for channel in channels:
+            channel.close()
+    wall = time.perf_counter() - start
+
+    done = [r for r in results if r is not None]
+    succeeded = [r for r in done if r["success"]]
+    # Only audio A2F accepted counts towards throughput
+    audio_seconds = sum(r.get("audio_seconds", 0) for r in succeeded)
+    summary = {
+        "files": len(files),
+        "succeeded": len(succeeded),
+        "failed": len(done) - len(succeeded),
+        "targets": len(targets),
+        "audio_seconds": audio_seconds,
+        "wall_seconds": wall,
+        "files_per_second": len(succeeded) / wall if wall else 0.0,
+        "realtime_factor": audio_seconds / wall if wall else 0.0,
+    }
+    return {"results": results, "summary": summary}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Push audio files to Audio2Face with the unary PushAudio RPC.")
+    parser.add_argument("source", help="Directory of audio files, a .txt/.json manifest, or a single file")
+    parser.add_argument("--target", action="append", default=[],
+                        help="A2F target as url=instance (repeatable). Defaults to A2F_BATCH_TARGETS or A2F_GRPC_URL/INSTANCE_NAME")
+    parser.add_argument("--samplerate", type=int, default=16000, help="Resample to this rate; 0 keeps each file's rate")
+    parser.add_argument("--no-block", dest="block", action="store_false",
+                        help="Return as soon as A2F accepts a file instead of when it has played; the next "
+                             "file then replaces it mid-render, so only for players that do not render")
+    parser.add_argument("--report", help="Write per-file results and the summary to this JSON file")
+    args = parser.parse_args()
+
+    files = collect_files(args.source)
+    if not files:
+        print(f"[Batch] No audio files found in {args.source}")
+        return 1
+    targets = list(dict.fromkeys([parse_target(t) for t in args.target] or default_targets()))
+    print(f"[Batch] Pushing {len(files)} files to {len(targets)} player(s), one call in flight each")
+
+    report = run_batch(files, targets, args.samplerate, args.block)
+    s = report["summary"]
+    print(f"[Batch] Done: {s['succeeded']}/{s['files']} succeeded, {s['audio_seconds']:.1f}s of audio in "
+          f"{s['wall_seconds']:.2f}s ({s['files_per_second']:.1f} files/s, {s['realtime_factor']:.1f}x real time)")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[Batch] Report written to {args.report}")
+    return 0 if s["failed"] == 0 else 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,85 @@
+"""
+Benchmarks the message directory lookup done on every /push_audio call:
+the old os.listdir + regex + sort scan against AudioIndex range queries.
+
+    python bench_audio_index.py --files 5000
+"""
+import argparse
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+from audio_index import AudioIndex, message_name
+from audio_meta_cache import AudioMetaCache
+
+
+def listdir_indices(directory):
+    # The lookup rest_client.py used before the index existed
+    files = os.listdir(directory)
+    return sorted(int(m.group(1)) for m in
+                  (re.match(r"message_(\d+)\.wav$", f) for f in files)
+                  if m)
+
+
+def timeit(fn, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=5000, help="Number of message files to create")
+    parser.add_argument("--repeat", type=int, default=200, help="Lookups per measurement")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="a2f_index_bench_")
+    try:
+        # Short WAVs: only the header matters for indexing
+        pcm = np.zeros(160, dtype=np.float32)
+        first = os.path.join(tmp, message_name(0))
+        sf.write(first, pcm, 16000)
+        for i in range(1, args.files):
+            shutil.copyfile(first, os.path.join(tmp, message_name(i)))
+        start = args.files - 10  # typical request: play the last few messages
+
+        cache_path = os.path.join(tmp, "meta_cache.json")
+        t0 = time.perf_counter()
+        index = AudioIndex(tmp, max_files=0, max_age=0, meta_cache=AudioMetaCache(cache_path))
+        build = time.perf_counter() - t0
+        index.meta_cache.flush()
+
+        # Same directory after a restart: metadata comes from the persisted cache
+        t0 = time.perf_counter()
+        AudioIndex(tmp, max_files=0, max_age=0, meta_cache=AudioMetaCache(cache_path))
+        rebuild = time.perf_counter() - t0
+
+        scan = timeit(lambda: [i for i in listdir_indices(tmp) if i >= start], args.repeat)
+        query = timeit(lambda: index.range_from(start), args.repeat)
+        idle_sync = timeit(index.sync, args.repeat)
+
+        path = os.path.join(tmp, message_name(args.files))
+        shutil.copyfile(first, path)
+        t0 = time.perf_counter()
+        index.add(args.files, path)
+        add = time.perf_counter() - t0
+
+        print(f"{args.files} files")
+        print(f"  initial index build (reads headers once)   {build * 1000:10.2f} ms")
+        print(f"  index build after restart (cached meta)    {rebuild * 1000:10.2f} ms")
+        print(f"  listdir + regex + sort per request        {scan * 1000:10.3f} ms")
+        print(f"  AudioIndex.range_from per request         {query * 1000:10.3f} ms  ({scan / query:,.0f}x faster)")
+        print(f"  watcher sync, directory unchanged         {idle_sync * 1000:10.3f} ms")
+        print(f"  add() one uploaded file                   {add * 1000:10.3f} ms")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmarks audio conditioning (audio_conditioning.py) against the straightforward
+NumPy version that allocates a temporary per step, and reports CPU cost per
+second of audio.
+
+    python bench_conditioning.py --seconds 30 --samplerate 48000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from audio_conditioning import AudioConditioner
+
+
+def naive_condition(audio_data, target_rms, max_gain, ceiling):
+    # What the same chain costs written step by step: every line is a full pass plus a new array
+    mono = np.average(audio_data, axis=1).astype(np.float32) if audio_data.ndim > 1 else audio_data.copy()
+    mono = mono - mono.mean()
+    rms = np.sqrt(np.mean(mono ** 2))
+    gain = min(target_rms / rms, max_gain) if rms > 0 else 1.0
+    mono = mono * gain
+    peak = np.abs(mono).max()
+    if peak > ceiling:
+        mono = mono * (ceiling / peak)
+    return mono.astype(np.float32)
+
+
+def make_speech_like(seconds, samplerate, channels, rng):
+    # Voiced bursts with pauses, a DC offset and a quiet level, like a soft TTS voice
+    t = np.arange(int(seconds * samplerate)) / samplerate
+    envelope = (np.sin(2 * np.pi * 2.5 * t) > -0.2).astype(np.float32)
+    tone = 0.05 * np.sin(2 * np.pi * 180 * t) + 0.02 * rng.standard_normal(len(t))
+    mono = (tone * envelope + 0.01).astype(np.float32)
+    if channels == 1:
+        return mono
+    return np.repeat(mono[:, None], channels, axis=1) * np.linspace(1.0, 0.8, channels, dtype=np.float32)
+
+
+def per_audio_second(fn, make_input, seconds, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        audio_data = make_input()
+        t0 = time.perf_counter()
+        fn(audio_data)
+        best = min(best, time.perf_counter() - t0)
+    return best / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=30.0, help="Length of the synthetic utterance")
+    parser.add_argument("--samplerate", type=int, default=48000)
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per measurement; the best is reported")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    conditioner = AudioConditioner(enabled=True)
+    target, max_gain, ceiling = conditioner.target_rms, conditioner.max_gain, conditioner.ceiling
+
+    print(f"{args.seconds:.0f}s utterance at {args.samplerate} Hz, CPU time per second of audio (best of {args.repeat})")
+    for channels in (1, 2):
+        source = make_speech_like(args.seconds, args.samplerate, channels, rng)
+
+        def fused(audio_data):
+            out, _ = conditioner.process(audio_data)
+            conditioner.release(out)
+
+        naive = per_audio_second(lambda a: naive_condition(a, target, max_gain, ceiling),
+                                 source.copy, args.seconds, args.repeat)
+        fast = per_audio_second(fused, source.copy, args.seconds, args.repeat)
+        downmix_only = per_audio_second(lambda a: a if a.ndim == 1 else np.average(a, axis=1).astype(np.float32),
+                                        source.copy, args.seconds, args.repeat)
+
+        out, stats = conditioner.process(source.copy())
+        expected = naive_condition(source, target, max_gain, ceiling)
+        error = float(np.max(np.abs(out - expected)))
+        out_rms_db = 20 * np.log10(np.sqrt(np.mean(out.astype(np.float64) ** 2)))
+        conditioner.release(out)
+
+        label = "mono" if channels == 1 else f"{channels} ch"
+        print(f"  {label}")
+        print(f"    old np.average downmix only       {downmix_only * 1e6:8.1f} us/s")
+        print(f"    step-by-step conditioning         {naive * 1e6:8.1f} us/s")
+        print(f"    AudioConditioner                  {fast * 1e6:8.1f} us/s  ({naive / fast:.1f}x faster, "
+              f"{1 / fast:,.0f}x real time)")
+        print(f"    gain {stats['gain_db']:+.1f} dB, output {out_rms_db:.1f} dBFS RMS "
+              f"(target {20 * np.log10(target):.0f}), peak limited: {stats['peak_limited']}, "
+              f"max diff vs step-by-step {error:.1e}")
+
+
+if __name__ == "__main__":
+    main()
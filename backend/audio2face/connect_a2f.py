@@ -1,85 +1,140 @@
-import requests
+"""
+Bootstraps a headless Audio2Face instance: loads the scene, sets the default
+emotion and activates the StreamLivelink exporter.
+
+Instead of fixed sleeps it polls A2F until each step's precondition holds,
+runs the independent setup calls concurrently over one pooled HTTP session,
+and skips work that is already done, so it is safe to run repeatedly.
+"""
+import argparse
 import json
-import subprocess
+import os
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor
 
+from a2f_rest import A2F_REST_URL, A2FRestClient, A2FRestError
+
+USD_FILE = os.getenv("A2F_USD_FILE", "C:/Users/mynam/Downloads/a2f.usd")
+FULLFACE_INSTANCE = os.getenv("A2F_FULLFACE_INSTANCE", "/World/audio2face/CoreFullface")
+LIVELINK_NODE = os.getenv("A2F_LIVELINK_NODE", "/World/audio2face/StreamLivelink")
+DEFAULT_EMOTION = [
+    0,
+    0.007047028746455909,
+    0,
+    0.016824722290039062,
+    0.03146043047308922,
+    0,
+    0.08242279827594757,
+    0,
+    0,
+    0.3256818950176239
+]
+
+
+def wait_until(predicate, timeout, initial_delay=0.1, max_delay=1.0):
+    """Polls predicate with jittered exponential backoff. Returns True once it holds, False on timeout."""
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    while True:
+        if predicate():
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(remaining, delay * random.uniform(0.5, 1.0)))
+        delay = min(delay * 2, max_delay)
+
+
+def retry(call, attempts=5, initial_delay=0.1, max_delay=1.0):
+    """Retries a REST call that may fail while A2F is still settling after a load."""
+    delay = initial_delay
+    for attempt in range(attempts):
+        try:
+            return call()
+        except A2FRestError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, max_delay)
+
+
+class StepTimer:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.steps = []
+
+    def record(self, name, t0):
+        self.steps.append((name, time.perf_counter() - t0))
+
+    def report(self):
+        print("Bootstrap timing:")
+        for name, seconds in self.steps:
+            print(f"  {name:<32} {seconds * 1000:8.0f} ms")
+        print(f"  {'total':<32} {(time.perf_counter() - self.start) * 1000:8.0f} ms")
 
-url = "http://localhost:8011/A2F/USD/Load"
-
-headers = {
-    "Accept-Language": "en-US,en;q=0.9",
-    "Connection": "keep-alive",
-    "Content-Type": "application/json",
-    "Origin": "http://localhost:8011",
-    "Referer": "http://localhost:8011/docs",
-    "Sec-Fetch-Dest": "empty",
-    "Sec-Fetch-Mode": "cors",
-    "Sec-Fetch-Site": "same-origin",
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/133.0.0.0 Safari/537.36",
-    "accept": "application/json",
-    "sec-ch-ua": '"Not(A:Brand";v="99", "Google Chrome";v="133", "Chromium";v="133"',
-    "sec-ch-ua-mobile": "?0",
-    "sec-ch-ua-platform": '"Windows"',
-}
-
-data = {
-    "file_name": "C:/Users/mynam/Downloads/a2f.usd"
-}
-
-response = requests.post(url, headers=headers, data=json.dumps(data))
-
-
-print("First Request Status:", response.status_code)
-print("First Request Response:", response.text)
-time.sleep(2)
-if response.status_code == 200:
-    curl1_command = [
-        "curl", "-X", "POST", "http://localhost:8011/A2F/A2E/SetEmotion",
-        "-H", "accept: application/json",
-        "-H", "Content-Type: application/json",
-        "-d", '''{
-            "a2f_instance": "/World/audio2face/CoreFullface",
-            "emotion": [
-                0,
-                0.007047028746455909,
-                0,
-                0.016824722290039062,
-                0.03146043047308922,
-                0,
-                0.08242279827594757,
-                0,
-                0,
-                0.3256818950176239
-            ]
-        }'''
-    ]
-    
-    curl1_response = subprocess.run(curl1_command, capture_output=True, text=True)
-
-    print("Curl1 Command Output:")
-    print(curl1_response.stdout)
-    print("Curl1 Command Error (if any):")
-    print(curl1_response.stderr)
-
-    time.sleep(2)
-    if curl1_response.returncode == 0:
-        curl2_command = [
-            "curl", "-X", "POST", "http://localhost:8011/A2F/Exporter/ActivateStreamLivelink",
-            "-H", "accept: application/json",
-            "-H", "Content-Type: application/json",
-            "-d", '''{
-                "node_path": "/World/audio2face/StreamLivelink",
-                "value": true
-            }'''
-        ]
 
-        curl2_response = subprocess.run(curl2_command, capture_output=True, text=True)
+def bootstrap(client, usd_file, fullface_instance, livelink_node, emotion, timeout=60, force_load=False):
+    timer = StepTimer()
 
-        print("Curl2 Command Output:")
-        print(curl2_response.stdout)
-        print("Curl2 Command Error (if any):")
-        print(curl2_response.stderr)
+    t0 = time.perf_counter()
+    if not wait_until(lambda: client.status(timeout=2), timeout):
+        raise A2FRestError(f"Audio2Face REST API at {client.base_url} not reachable after {timeout}s")
+    timer.record("wait for A2F", t0)
+
+    t0 = time.perf_counter()
+    if not force_load and client.has_instance(fullface_instance):
+        print(f"Scene already loaded ({fullface_instance} present), skipping USD/Load.")
+        timer.record("USD/Load (skipped)", t0)
     else:
-        print("curl1 failed, skipping curl2.")
-else:
-    print("First request failed, skipping curl1 and curl2.")
+        print("USD/Load:", client.load_usd(usd_file))
+        timer.record("USD/Load", t0)
+        t0 = time.perf_counter()
+        if not wait_until(lambda: client.has_instance(fullface_instance), timeout):
+            raise A2FRestError(f"{fullface_instance} did not appear after loading {usd_file}")
+        timer.record("wait for instances", t0)
+
+    # SetEmotion and ActivateStreamLivelink touch different nodes, run them side by side
+    def timed(name, call):
+        t = time.perf_counter()
+        result = retry(call)
+        return name, result, time.perf_counter() - t
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [
+            pool.submit(timed, "A2E/SetEmotion", lambda: client.set_emotion(fullface_instance, emotion)),
+            pool.submit(timed, "Exporter/ActivateStreamLivelink",
+                        lambda: client.activate_stream_livelink(livelink_node, True)),
+        ]
+        for future in futures:
+            name, result, seconds = future.result()
+            print(f"{name}:", result)
+            timer.steps.append((name, seconds))
+
+    timer.report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the A2F scene, set emotion and activate StreamLivelink.")
+    parser.add_argument("--url", default=A2F_REST_URL, help="A2F REST base URL")
+    parser.add_argument("--usd", default=USD_FILE, help="USD scene to load")
+    parser.add_argument("--instance", default=FULLFACE_INSTANCE, help="A2F fullface instance path")
+    parser.add_argument("--livelink-node", default=LIVELINK_NODE, help="StreamLivelink node path")
+    parser.add_argument("--emotion", type=json.loads, default=DEFAULT_EMOTION, help="Emotion vector as a JSON list")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for A2F and the scene")
+    parser.add_argument("--force-load", action="store_true", help="Reload the USD even if the instance exists")
+    args = parser.parse_args()
+
+    client = A2FRestClient(args.url)
+    try:
+        bootstrap(client, args.usd, args.instance, args.livelink_node, args.emotion, args.timeout, args.force_load)
+    except A2FRestError as e:
+        print(f"Bootstrap failed: {e}")
+        return 1
+    finally:
+        client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,164 @@
+"""
+Always-available, low-overhead diagnostics for the running grpc_client.py process:
+
+- SamplingProfiler: on demand, samples every thread's stack for N seconds and writes
+  collapsed stacks ("frame;frame;frame count" per line), the input format of
+  flamegraph.pl, speedscope and inferno.
+- LoopMonitor: continuously measures asyncio event-loop lag and reports callbacks
+  that hold the loop longer than a threshold.
+"""
+import asyncio
+import collections
+import os
+import sys
+import threading
+import time
+
+PROFILE_DIR = os.getenv("A2F_PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+PROFILE_INTERVAL = float(os.getenv("A2F_PROFILE_INTERVAL", "0.005"))  # seconds between samples
+PROFILE_MAX_SECONDS = 300
+LOOP_LAG_INTERVAL = float(os.getenv("A2F_LOOP_LAG_INTERVAL", "0.1"))  # seconds between lag probes
+LOOP_LAG_WARN_MS = float(os.getenv("A2F_LOOP_LAG_WARN_MS", "50"))
+SLOW_CALLBACK_MS = float(os.getenv("A2F_SLOW_CALLBACK_MS", "100"))  # 0 disables callback timing
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is still running."""
+
+
+class SamplingProfiler:
+    """Samples Python stacks of all threads from a background thread; one capture at a time."""
+
+    def __init__(self, interval=PROFILE_INTERVAL, out_dir=PROFILE_DIR):
+        self.interval = interval
+        self.out_dir = out_dir
+        self._busy = threading.Lock()
+
+    @property
+    def running(self):
+        return self._busy.locked()
+
+    def capture(self, seconds):
+        """Blocks for `seconds` while sampling, writes the folded stacks and returns the file path."""
+        seconds = max(0.1, min(float(seconds), PROFILE_MAX_SECONDS))
+        if not self._busy.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already being captured")
+        try:
+            counts = collections.Counter()
+            me = threading.get_ident()
+            names = {}
+            samples = 0
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                if len(names) != threading.active_count():
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                        frame = frame.f_back
+                    stack.append(names.get(ident, f"thread-{ident}"))
+                    counts[";".join(reversed(stack))] += 1
+                samples += 1
+                time.sleep(self.interval)
+
+            os.makedirs(self.out_dir, exist_ok=True)
+            path = os.path.join(self.out_dir, f"profile_{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}.folded")
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in counts.most_common():
+                    f.write(f"{stack} {count}\n")
+            print(f"[Diagnostics] Wrote {samples} samples over {seconds:.1f}s to {path}")
+            return path
+        finally:
+            self._busy.release()
+
+    async def capture_async(self, seconds):
+        return await asyncio.to_thread(self.capture, seconds)
+
+
+class LoopMonitor:
+    """
+    Measures how late a periodic sleep wakes up (event-loop lag) and, when
+    SLOW_CALLBACK_MS > 0, times every loop callback to name the ones that block it.
+    """
+
+    def __init__(self, interval=LOOP_LAG_INTERVAL, warn_ms=LOOP_LAG_WARN_MS, slow_callback_ms=SLOW_CALLBACK_MS):
+        self.interval = interval
+        self.warn_ms = warn_ms
+        self.slow_callback_ms = slow_callback_ms
+        self.lags = collections.deque(maxlen=600)  # last minute at the default interval, in ms
+        self.max_lag_ms = 0.0
+        self.lag_warnings = 0
+        self.slow_callbacks = collections.deque(maxlen=50)
+        self._task = None
+        self._original_run = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._probe())
+        if self.slow_callback_ms > 0:
+            self._patch_handles()
+
+    async def stop(self):
+        if self._original_run is not None:
+            asyncio.events.Handle._run = self._original_run
+            self._original_run = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _probe(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (loop.time() - expected) * 1000)
+            self.lags.append(lag_ms)
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            if lag_ms > self.warn_ms:
+                self.lag_warnings += 1
+                print(f"[Diagnostics] [WARN] Event loop lag {lag_ms:.0f} ms")
+
+    def _patch_handles(self):
+        # asyncio's own slow_callback_duration only works in debug mode, which is far too
+        # expensive to leave on; timing Handle._run directly costs two clock reads per callback.
+        monitor = self
+        original = self._original_run = asyncio.events.Handle._run
+        threshold = self.slow_callback_ms / 1000
+
+        def timed_run(handle):
+            t0 = time.perf_counter()
+            try:
+                return original(handle)
+            finally:
+                elapsed = time.perf_counter() - t0
+                if elapsed > threshold:
+                    monitor._report_slow(handle, elapsed)
+
+        asyncio.events.Handle._run = timed_run
+
+    def _report_slow(self, handle, elapsed):
+        callback = getattr(handle, "_callback", None)
+        name = getattr(callback, "__qualname__", None) or repr(callback)
+        # Task steps show up as Task.__step; name the coroutine instead
+        task = getattr(callback, "__self__", None)
+        if isinstance(task, asyncio.Task):
+            name = f"Task {task.get_name()} ({task.get_coro().__qualname__})"
+        self.slow_callbacks.append({"callback": name, "ms": round(elapsed * 1000, 1), "at": time.time()})
+        print(f"[Diagnostics] [WARN] Slow callback {name} held the event loop for {elapsed * 1000:.0f} ms")
+
+    def stats(self):
+        lags = sorted(self.lags)
+        n = len(lags)
+        return {
+            "lag_p50_ms": round(lags[n // 2], 2) if n else None,
+            "lag_p99_ms": round(lags[min(n - 1, int(n * 0.99))], 2) if n else None,
+            "lag_max_ms": round(self.max_lag_ms, 2),
+            "lag_warnings": self.lag_warnings,
+            "slow_callbacks": list(self.slow_callbacks),
+        }
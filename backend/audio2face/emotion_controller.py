@@ -0,0 +1,76 @@
+import os
+import threading
+import time
+
+from a2f_rest import A2FRestClient, A2FRestError
+
+A2F_EMOTION_INSTANCE = os.getenv("A2F_FULLFACE_INSTANCE", "/World/audio2face/CoreFullface")
+# Skip SetEmotion unless some component moved by more than this
+EMOTION_EPSILON = float(os.getenv("A2F_EMOTION_EPSILON", "0.02"))
+
+
+class EmotionController:
+    """
+    Sends per-utterance emotion vectors to A2E SetEmotion off the hot path.
+
+    update() only records the latest vector and returns immediately; a background
+    thread sends it right away over the client's keep-alive session, unless it is
+    within epsilon of what A2F already has. Updates that arrive while a call is in
+    flight collapse into a single follow-up call carrying the newest vector.
+    """
+
+    def __init__(self, client=None, instance=A2F_EMOTION_INSTANCE,
+                 epsilon=EMOTION_EPSILON):
+        self.client = client or A2FRestClient()
+        self.instance = instance
+        self.epsilon = epsilon
+        self.sent = None       # last vector A2F acknowledged
+        self._pending = None   # newest vector not yet sent
+        self._cond = threading.Condition()
+        self._stopped = False
+        self.stats = {"requested": 0, "sent": 0, "skipped": 0, "coalesced": 0, "failed": 0}
+        self._thread = threading.Thread(target=self._run, name="emotion", daemon=True)
+        self._thread.start()
+
+    def update(self, emotion):
+        """Queues an emotion vector. Non-blocking; safe to call from the event loop."""
+        vector = [float(v) for v in emotion]
+        with self._cond:
+            self.stats["requested"] += 1
+            if self._pending is not None:
+                self.stats["coalesced"] += 1
+            self._pending = vector
+            self._cond.notify()
+
+    def changed(self, vector):
+        if self.sent is None or len(vector) != len(self.sent):
+            return True
+        return max(abs(a - b) for a, b in zip(vector, self.sent)) > self.epsilon
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                # Sent as soon as it arrives, so it lands with the utterance it belongs to
+                vector, self._pending = self._pending, None
+            if not self.changed(vector):
+                self.stats["skipped"] += 1
+                continue
+            t0 = time.perf_counter()
+            try:
+                self.client.set_emotion(self.instance, vector)
+                self.sent = vector
+                self.stats["sent"] += 1
+                print(f"[Emotion] SetEmotion on {self.instance} in {(time.perf_counter() - t0) * 1000:.0f} ms")
+            except A2FRestError as e:
+                self.stats["failed"] += 1
+                print(f"[Emotion] [WARN] {e}")
+
+    def close(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join(timeout=1)
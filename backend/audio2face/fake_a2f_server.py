@@ -0,0 +1,91 @@
+"""
+Stand-in Audio2Face gRPC server for replay and load tests.
+
+It accepts PushAudio/PushAudioStream like A2F and, when the client asks to block
+until playback is finished, holds the call for the audio's duration divided by
+--speed, so timing behaves like a real player without a GPU.
+
+    python fake_a2f_server.py --port 50051 --speed 1
+"""
+import argparse
+import threading
+import time
+from concurrent import futures
+
+import grpc
+
+import audio2face_pb2
+import audio2face_pb2_grpc
+
+BYTES_PER_SAMPLE = 4  # float32 PCM
+
+
+class FakeAudio2Face(audio2face_pb2_grpc.Audio2FaceServicer):
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.audio_seconds = 0.0
+
+    def _account(self, seconds):
+        with self.lock:
+            self.calls += 1
+            self.audio_seconds += seconds
+
+    def _hold(self, started, seconds):
+        if self.speed > 0:
+            remaining = started + seconds / self.speed - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+
+    def PushAudio(self, request, context):
+        started = time.monotonic()
+        seconds = len(request.audio_data) / BYTES_PER_SAMPLE / max(1, request.samplerate)
+        if request.block_until_playback_is_finished:
+            self._hold(started, seconds)
+        self._account(seconds)
+        return audio2face_pb2.PushAudioResponse(success=True, message=f"played {seconds:.3f}s")
+
+    def PushAudioStream(self, request_iterator, context):
+        start = None
+        samples = 0
+        started = None
+        for request in request_iterator:
+            if request.HasField("start_marker"):
+                start = request.start_marker
+            else:
+                if started is None:
+                    started = time.monotonic()  # playback starts with the first chunk
+                samples += len(request.audio_data) // BYTES_PER_SAMPLE
+        if start is None:
+            return audio2face_pb2.PushAudioStreamResponse(success=False, message="missing start_marker")
+        seconds = samples / max(1, start.samplerate)
+        if start.block_until_playback_is_finished and started is not None:
+            self._hold(started, seconds)
+        self._account(seconds)
+        return audio2face_pb2.PushAudioStreamResponse(success=True, message=f"played {seconds:.3f}s")
+
+
+def serve(port=0, speed=1.0, host="127.0.0.1"):
+    """Starts a fake server; returns (server, servicer, bound_port)."""
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=8))
+    servicer = FakeAudio2Face(speed)
+    audio2face_pb2_grpc.add_Audio2FaceServicer_to_server(servicer, server)
+    bound_port = server.add_insecure_port(f"{host}:{port}")
+    server.start()
+    return server, servicer, bound_port
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=50051)
+    parser.add_argument("--speed", type=float, default=1.0, help="Playback speed; 0 returns immediately")
+    args = parser.parse_args()
+    server, _, port = serve(args.port, args.speed, args.host)
+    print(f"Fake Audio2Face listening on {args.host}:{port} (speed {args.speed}x)")
+    server.wait_for_termination()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,72 +1,389 @@
+import time
+_T_START = time.perf_counter()
 import asyncio
 import websockets
-import numpy as np
-import soundfile as sf
-import io
-import time
-import audio2face_pb2
-import audio2face_pb2_grpc
-import grpc
+from websockets.protocol import State
 import json # For parsing the header
 import os
+import hmac
+import http
+import ipaddress
+import signal
+import socket
+import threading
 from dotenv import load_dotenv
+from session_recorder import new_recorder
+from diagnostics import SamplingProfiler, LoopMonitor, ProfilerBusy
+import handoff
+_T_LIGHT_IMPORTS = time.perf_counter()
 
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
+_T_DOTENV = time.perf_counter()
+
+# Heavy dependencies (numpy, soundfile, grpc, protobuf, requests) are imported by
+# load_dependencies() on a worker thread while the WebSocket listener binds; code
+# that needs them waits on deps_loaded first.
+np = grpc = audio2face_pb2 = audio2face_pb2_grpc = None
+audio_codec = a2f_stream = emotion_controller_module = audio_conditioning = None
+deps_loaded = threading.Event()
 A2F_GRPC_URL = os.getenv("A2F_GRPC_URL", "localhost:50051")
 INSTANCE_NAME = os.getenv("INSTANCE_NAME", "/World/audio2face/PlayerStreaming")
+# Comma-separated instances primed at startup; defaults to the streaming player we play through.
+WARMUP_INSTANCES = [i.strip() for i in os.getenv("A2F_WARMUP_INSTANCES", INSTANCE_NAME).split(",") if i.strip()]
+WARMUP_TIMEOUT = float(os.getenv("A2F_WARMUP_TIMEOUT", "30"))  # seconds to wait for A2F to come up
+WARMUP_CLIP_SECONDS = 0.1
+WARMUP_SAMPLERATE = 16000
+WS_HOST = os.getenv("A2F_WS_HOST", "0.0.0.0")
+WS_PORT = int(os.getenv("A2F_WS_PORT", "8765"))
+# JSON-lines file receiving per-utterance stage latencies (used by replay_sessions.py); empty disables
+STAGE_LOG = os.getenv("A2F_STAGE_LOG", "")
+PROFILE_SIGNAL_SECONDS = float(os.getenv("A2F_PROFILE_SIGNAL_SECONDS", "10"))  # profile length on SIGUSR1
+# Touched (pid + time) once the listener is bound and A2F is warm, removed on shutdown; empty disables
+READY_FILE = os.getenv("A2F_READY_FILE", "")
+# SIGTERM/SIGINT behaviour: "drain" plays out the queue first, "immediate" spills it right away.
+# The "drain" control message always drains, for Windows, where PM2 cannot signal the process.
+# SIGHUP (or the "reload" control message) hands the socket and queue to a new process instead.
+SHUTDOWN_MODE = os.getenv("A2F_SHUTDOWN_MODE", "drain")
+DRAIN_TIMEOUT = float(os.getenv("A2F_DRAIN_TIMEOUT", "120"))  # seconds; what is left is spilled
+HANDOFF_TIMEOUT = float(os.getenv("A2F_HANDOFF_TIMEOUT", "30"))  # seconds for a successor to start listening
+# Queue left over at shutdown, played first on the next start unless older than A2F_SPILL_MAX_AGE seconds
+SPILL_FILE = os.getenv("A2F_SPILL_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".a2f_spill.a2fq"))
+SPILL_MAX_AGE = float(os.getenv("A2F_SPILL_MAX_AGE", "60"))
+# "profile", "reload" and "drain" control messages are accepted from loopback peers, or from
+# anyone sending {"token": ...} equal to A2F_CONTROL_TOKEN when it is set
+CONTROL_TOKEN = os.getenv("A2F_CONTROL_TOKEN", "")
+PRIVILEGED_CONTROLS = {"profile", "reload", "drain"}
+# PM2 sets pm_id; it restarts the process when it exits, which a hot-reload successor cannot survive
+UNDER_PM2 = "pm_id" in os.environ
 
-# Global queue for audio data (audio_data, samplerate, websocket_id_for_logging)
+# Global queue for audio data (audio_data, samplerate, websocket_id_for_logging, emotion_vector_or_None, stage_timestamps)
 audio_queue = asyncio.Queue()
 
+# Utterances are queued in the order their END arrived: each upload takes a ticket at END and
+# its decoded audio waits in decoded_ahead until every earlier ticket is queued or dropped
+next_ticket = 0
+next_to_queue = 0
+decoded_ahead = {}
+
 # Counter and lock for unique WebSocket connection IDs for logging
 websocket_counter = 0
 websocket_counter_lock = asyncio.Lock()
 
+# Long-lived channel to Audio2Face, opened once in main() and reused for every utterance
+a2f_channel = None
+# Applies per-utterance emotion vectors via A2E SetEmotion in the background
+emotion_controller = None
+# Downmix + loudness normalisation for decoded audio (see audio_conditioning.py)
+conditioner = None
+# Set once warmup has finished (successfully or not); the processor waits on it
+warmup_done = asyncio.Event()
+# True once every warmup instance accepted a clip; reported by the /ready endpoint
+a2f_ready = False
+stage_log_file = None
+# Shutdown/reload requests from signals or control messages; shutdown_mode says which
+shutdown_requested = asyncio.Event()
+shutdown_mode = None
+# Processor state, so a restart can let the in-flight utterance finish and stop before the next one
+processor_busy = False
+processor_stopping = False
+stream_abort = threading.Event()  # cuts the in-flight stream short ("immediate" shutdown)
+# On-demand stack sampling and continuous event-loop lag tracking (see diagnostics.py)
+profiler = SamplingProfiler()
+loop_monitor = None
+
+
+def load_dependencies():
+    """Imports the heavy modules into this module's globals. Returns the time it took."""
+    global np, grpc, audio2face_pb2, audio2face_pb2_grpc, audio_codec, a2f_stream, emotion_controller_module
+    global audio_conditioning, conditioner
+    t0 = time.perf_counter()
+    import numpy
+    import grpc as grpc_module
+    import audio2face_pb2 as pb2
+    import audio2face_pb2_grpc as pb2_grpc
+    import audio_codec as audio_codec_module
+    import a2f_stream as a2f_stream_module
+    import emotion_controller as emotion_module
+    import audio_conditioning as conditioning_module
+    np, grpc, audio2face_pb2, audio2face_pb2_grpc = numpy, grpc_module, pb2, pb2_grpc
+    audio_codec, a2f_stream, emotion_controller_module = audio_codec_module, a2f_stream_module, emotion_module
+    audio_conditioning = conditioning_module
+    # Handlers use the conditioner as soon as deps_loaded is set, so it is built here
+    conditioner = audio_conditioning.AudioConditioner()
+    deps_loaded.set()
+    return time.perf_counter() - t0
+
+
+async def wait_for_dependencies():
+    if not deps_loaded.is_set():
+        await asyncio.to_thread(deps_loaded.wait)
+
+
+def notify_ready():
+    """Announces readiness: A2F_READY_FILE and, under systemd, sd_notify READY=1."""
+    if READY_FILE:
+        with open(READY_FILE, "w", encoding="utf-8") as f:
+            f.write(f"{os.getpid()} {time.time():.3f}\n")
+    notify_socket = os.getenv("NOTIFY_SOCKET")
+    if notify_socket and hasattr(socket, "AF_UNIX"):
+        if notify_socket.startswith("@"):  # abstract namespace
+            notify_socket = "\0" + notify_socket[1:]
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+                # MAINPID lets systemd follow a hot-reloaded successor (needs NotifyAccess=all)
+                sock.sendto(f"MAINPID={os.getpid()}\nREADY=1".encode(), notify_socket)
+        except OSError as e:
+            print(f"[Startup] [WARN] sd_notify failed: {e}")
+
+
+def clear_ready():
+    if READY_FILE:
+        try:
+            os.remove(READY_FILE)
+        except FileNotFoundError:
+            pass
+
+
+def log_stages(ws_id, t):
+    """Appends one utterance's stage latencies (ms) to STAGE_LOG, computed from perf_counter stamps."""
+    global stage_log_file
+    if not STAGE_LOG:
+        return
+    def ms(a, b):
+        return round((t[b] - t[a]) * 1000, 3) if a in t and b in t else None
+    stages = {
+        "ws_id": ws_id,
+        "receive": ms("header", "end"),
+        "decode": ms("end", "decoded"),
+        "queue_wait": ms("enqueued", "dequeued"),
+        "first_chunk": ms("dequeued", "first_chunk"),
+        "stream": ms("dequeued", "done"),
+        "end_to_first_chunk": ms("end", "first_chunk"),
+    }
+    if stage_log_file is None:
+        stage_log_file = open(STAGE_LOG, "a", encoding="utf-8")
+    stage_log_file.write(json.dumps(stages) + "\n")
+    stage_log_file.flush()
+
+
+def warmup_a2f(channel, push_clips=True):
+    """
+    Blocks until the channel is connected, then pushes a short silent clip to each
+    warmup instance so A2F-side cold start does not land on the first real utterance.
+    With push_clips=False only the connection is checked.
+    Returns {instance: round_trip_ms}; raises on failure.
+    """
+    t0 = time.perf_counter()
+    grpc.channel_ready_future(channel).result(timeout=WARMUP_TIMEOUT)
+    print(f"[Warmup] Connected to Audio2Face at {A2F_GRPC_URL} in {(time.perf_counter() - t0) * 1000:.0f} ms")
+    if not push_clips:
+        return {}
+
+    stub = audio2face_pb2_grpc.Audio2FaceStub(channel)
+    silence = np.zeros(int(WARMUP_SAMPLERATE * WARMUP_CLIP_SECONDS), dtype=np.float32).tobytes()
+    round_trips = {}
+    for instance in WARMUP_INSTANCES:
+        def warmup_stream():
+            start_marker = audio2face_pb2.PushAudioRequestStart(
+                instance_name=instance,
+                samplerate=WARMUP_SAMPLERATE,
+                block_until_playback_is_finished=False
+            )
+            yield audio2face_pb2.PushAudioStreamRequest(start_marker=start_marker)
+            yield audio2face_pb2.PushAudioStreamRequest(audio_data=silence)
+
+        t1 = time.perf_counter()
+        response = stub.PushAudioStream(warmup_stream(), timeout=WARMUP_TIMEOUT)
+        round_trips[instance] = (time.perf_counter() - t1) * 1000
+        if not response.success:
+            raise RuntimeError(f"{instance} rejected warmup clip: {response.message}")
+        print(f"[Warmup] {instance} primed, round trip {round_trips[instance]:.0f} ms")
+    return round_trips
+
+
+async def run_warmup():
+    """
+    Runs warmup off the event loop so the listener keeps accepting and queueing audio meanwhile.
+    The processor is released after the first attempt either way; failed attempts are retried
+    with backoff so readiness is still announced once A2F comes up. Retries only wait for the
+    connection: by then the processor may be streaming real audio to the same instances, and
+    a silent clip pushed alongside would interleave with it.
+    """
+    global a2f_ready
+    delay = 1.0
+    push_clips = True
+    while True:
+        try:
+            await asyncio.to_thread(warmup_a2f, a2f_channel, push_clips)
+            a2f_ready = True
+            print("[Warmup] Audio2Face is warm. Ready." if push_clips else "[Warmup] Audio2Face is reachable. Ready.")
+            return
+        except Exception as e:
+            push_clips = False
+            print(f"[Warmup] [WARN] Warmup failed, continuing cold, retrying the connection in {delay:.0f}s: {e}")
+        finally:
+            warmup_done.set()
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 30)
+
+
+async def announce_ready(warmup_task, timings):
+    """Once the listener is bound and A2F is warm: print the startup breakdown and signal readiness."""
+    t0 = time.perf_counter()
+    await warmup_task
+    timings.append(("A2F connect + warmup", time.perf_counter() - t0))
+    print("[Startup] Breakdown:")
+    for name, seconds in timings:
+        print(f"[Startup]   {name:<28} {seconds * 1000:8.0f} ms")
+    print(f"[Startup]   {'total to ready':<28} {(time.perf_counter() - _T_START) * 1000:8.0f} ms")
+    notify_ready()
+    print("[Startup] READY")
+
+
+async def health_check(path, request_headers):
+    """Answers plain HTTP GET /ready on the WebSocket port: 200 once warm, 503 before."""
+    if path == "/ready":
+        if a2f_ready:
+            return http.HTTPStatus.OK, [], b"ready\n"
+        return http.HTTPStatus.SERVICE_UNAVAILABLE, [], b"warming up\n"
+    if path == "/diagnostics":
+        body = json.dumps({"pid": os.getpid(),
+                           "loop": loop_monitor.stats() if loop_monitor else None,
+                           "profiling": profiler.running,
+                           "queued": audio_queue.qsize()}).encode()
+        return http.HTTPStatus.OK, [("Content-Type", "application/json")], body
+    return None
+
+
+def control_allowed(websocket, header_data):
+    """Privileged control messages: loopback peers, or a matching A2F_CONTROL_TOKEN."""
+    if CONTROL_TOKEN and hmac.compare_digest(str(header_data.get("token", "")), CONTROL_TOKEN):
+        return True
+    peer = websocket.remote_address
+    try:
+        address = ipaddress.ip_address(peer[0])
+    except (TypeError, ValueError, IndexError):
+        return False
+    if getattr(address, "ipv4_mapped", None):
+        address = address.ipv4_mapped
+    return address.is_loopback
+
+
+async def handle_control(websocket, ws_id, header_data):
+    """
+    Control messages share the audio port: a JSON header with "control" instead of audio.
+        {"control": "profile", "seconds": 10} -> samples all threads, replies with the profile path
+        {"control": "stats"}                   -> replies with event-loop lag stats
+        {"control": "reload"}                  -> hot reload, for platforms without SIGHUP
+        {"control": "drain"}                   -> drain shutdown, for platforms without SIGTERM (PM2 on Windows)
+    "profile", "reload" and "drain" are only accepted from loopback or with A2F_CONTROL_TOKEN as "token".
+    """
+    command = header_data.get("control")
+    print(f"[WS-{ws_id}] Control message: {command}")
+    if command in PRIVILEGED_CONTROLS and not control_allowed(websocket, header_data):
+        print(f"[WS-{ws_id}] [WARN] Refused '{command}' from {websocket.remote_address}: not loopback and no valid token.")
+        reply = {"status": "error", "error": f"'{command}' requires a loopback connection or A2F_CONTROL_TOKEN"}
+    elif command == "profile":
+        try:
+            path = await profiler.capture_async(header_data.get("seconds", PROFILE_SIGNAL_SECONDS))
+            reply = {"status": "ok", "profile": path}
+        except ProfilerBusy as e:
+            reply = {"status": "busy", "error": str(e)}
+    elif command == "stats":
+        reply = {"status": "ok", "loop": loop_monitor.stats() if loop_monitor else None}
+    elif command == "reload" and UNDER_PM2:
+        reply = {"status": "error", "error": "Hot reload is not supported under PM2; send 'drain' instead, "
+                                             "PM2 restarts the client once it has drained"}
+    elif command == "reload":
+        request_shutdown("reload")
+        reply = {"status": "ok", "reloading": True, "pid": os.getpid()}
+    elif command == "drain":
+        request_shutdown("drain")
+        reply = {"status": "ok", "draining": True, "pid": os.getpid()}
+    else:
+        reply = {"status": "error", "error": f"Unknown control command '{command}'"}
+    await websocket.send(json.dumps(reply))
+
+
+def start_signal_profile():
+    """SIGUSR1 handler: capture a profile in the background without touching the audio path."""
+    if profiler.running:
+        print("[Diagnostics] Profile already running, ignoring signal.")
+        return
+    asyncio.create_task(profiler.capture_async(PROFILE_SIGNAL_SECONDS))
+
+
+def request_shutdown(mode):
+    """Signal handler / control entry point: mode is "drain", "immediate" or "reload"."""
+    global shutdown_mode
+    if shutdown_requested.is_set():
+        print(f"[Shutdown] Already shutting down ({shutdown_mode}), ignoring {mode} request.")
+        return
+    shutdown_mode = mode
+    shutdown_requested.set()
+
+def release_ticket(ticket, item):
+    """
+    Hands in the queue item for END ticket `ticket`, or None if the upload produced nothing,
+    and queues every item whose turn has come.
+    """
+    global next_to_queue
+    decoded_ahead[ticket] = item
+    while next_to_queue in decoded_ahead:
+        item = decoded_ahead.pop(next_to_queue)
+        next_to_queue += 1
+        if item is not None:
+            _, _, ws_id, _, timing = item
+            timing["enqueued"] = time.perf_counter()
+            audio_queue.put_nowait(item)
+            print(f"[WS-{ws_id}] Audio data added to the processing queue.")
+
+
 async def audio_processor():
     """
     Continuously processes audio from the queue and sends it to Audio2Face.
     Ensures sequential playback.
     """
+    global processor_busy
     print("Audio processor worker started.")
-    while True:
+    await warmup_done.wait()
+    while not processor_stopping:
         try:
-            audio_data, samplerate, ws_id = await audio_queue.get()
+            audio_data, samplerate, ws_id, emotion, timing = await audio_queue.get()
+            processor_busy = True
+            timing["dequeued"] = time.perf_counter()
             print(f"[Processor WS-{ws_id}] Got audio from queue. Shape: {audio_data.shape}, Samplerate: {samplerate}")
 
-            chunk_size = int(samplerate // 10)  # 0.1s per chunk
-            sleep_between_chunks = 0.04  # Original value from user's code
+            # Emotion goes out on the controller's thread as this utterance starts, never blocking the stream
+            if emotion is not None:
+                emotion_controller.update(emotion)
+
             block_until_playback_is_finished = True
 
             def grpc_stream_generator():
-                # First message: start_marker
-                start_marker = audio2face_pb2.PushAudioRequestStart(
-                    instance_name=INSTANCE_NAME,
-                    samplerate=int(samplerate),
-                    block_until_playback_is_finished=block_until_playback_is_finished
-                )
-                yield audio2face_pb2.PushAudioStreamRequest(start_marker=start_marker)
-                
-                # Then send PCM chunks
-                total_samples = len(audio_data)
-                for i in range(0, total_samples, chunk_size):
-                    chunk = audio_data[i:i+chunk_size]
-                    yield audio2face_pb2.PushAudioStreamRequest(audio_data=chunk.astype(np.float32).tobytes())
-                    # This sleep paces the data transfer to Audio2Face.
-                    # Since this worker is dedicated, time.sleep() is acceptable here,
-                    # as the gRPC call itself is blocking when block_until_playback_is_finished=True.
-                    time.sleep(sleep_between_chunks)
+                # Start marker, then PCM chunks paced towards Audio2Face
+                for n, request in enumerate(a2f_stream.stream_requests(INSTANCE_NAME, samplerate, [audio_data],
+                                                            block_until_playback_is_finished=block_until_playback_is_finished,
+                                                            should_stop=stream_abort.is_set)):
+                    if n == 1:
+                        timing["first_chunk"] = time.perf_counter()
+                    yield request
                 print(f"[Processor WS-{ws_id}] Finished yielding all chunks to gRPC.")
 
             try:
-                with grpc.insecure_channel(A2F_GRPC_URL) as channel:
-                    stub = audio2face_pb2_grpc.Audio2FaceStub(channel)
-                    print(f"[Processor WS-{ws_id}] Starting gRPC PushAudioStream to Audio2Face...")
-                    response = stub.PushAudioStream(grpc_stream_generator())
-                    print(f"[Processor WS-{ws_id}] Audio2Face gRPC streaming response: Success={response.success}, Message='{response.message}'")
+                stub = audio2face_pb2_grpc.Audio2FaceStub(a2f_channel)
+                print(f"[Processor WS-{ws_id}] Starting gRPC PushAudioStream to Audio2Face...")
+                # On a worker thread, so sockets, signals and restarts are served while A2F plays
+                response = await asyncio.to_thread(stub.PushAudioStream, grpc_stream_generator())
+                print(f"[Processor WS-{ws_id}] Audio2Face gRPC streaming response: Success={response.success}, Message='{response.message}'")
             except Exception as e:
                 print(f"[Processor WS-{ws_id}] Failed to stream audio to Audio2Face: {e}")
             finally:
+                timing["done"] = time.perf_counter()
+                log_stages(ws_id, timing)
+                conditioner.release(audio_data)
                 audio_queue.task_done() # Signal that the item from the queue is processed
+                processor_busy = False
                 print(f"[Processor WS-{ws_id}] Task done.")
         except asyncio.CancelledError:
             print("[Processor] Audio processor task cancelled.")
@@ -84,17 +401,21 @@ async def audio_processor():
 
 
 async def handle_audio_stream(websocket, path):
-    global websocket_counter
+    global websocket_counter, next_ticket
     async with websocket_counter_lock:
         ws_id = websocket_counter
         websocket_counter += 1
     
     print(f"WebSocket client WS-{ws_id} connected.")
     samplerate = None
+    recorder = None  # audio sessions only, when A2F_RECORD_DIR is configured
+    timing = {}
+    ticket = None  # queue position, taken when END arrives
 
     try:
         # Expect the first message to be a JSON header with sample rate info
         header_message = await websocket.recv()
+        timing["header"] = time.perf_counter()
         if not isinstance(header_message, str): # JSON header should be a string
             print(f"[WS-{ws_id}] [ERROR] Expected JSON header (string) as first message, got {type(header_message)}.")
             await websocket.close()
@@ -102,20 +423,43 @@ async def handle_audio_stream(websocket, path):
         
         try:
             header_data = json.loads(header_message)
+            if "control" in header_data:
+                await handle_control(websocket, ws_id, header_data)
+                return
+            # Control messages (and their tokens) are never recorded, so replays cannot re-run them
+            recorder = new_recorder(ws_id)
+            if recorder:
+                recorder.record(header_message)
             samplerate = int(header_data.get("sample_rate", 16000)) # Default if not provided
-            print(f"[WS-{ws_id}] Received stream header: samplerate={samplerate}")
+            await wait_for_dependencies()
+            audio_format = audio_codec.normalize_format(header_data.get("format", "wav"))
+            emotion = header_data.get("emotion")
+            if emotion is not None and (not isinstance(emotion, list)
+                                        or not all(isinstance(v, (int, float)) for v in emotion)):
+                print(f"[WS-{ws_id}] [WARN] Ignoring invalid emotion vector: {emotion}")
+                emotion = None
+            print(f"[WS-{ws_id}] Received stream header: samplerate={samplerate}, format={audio_format}, emotion={emotion}")
         except json.JSONDecodeError:
             print(f"[WS-{ws_id}] [ERROR] Failed to parse JSON header: {header_message}")
             await websocket.close()
             return
+        except ValueError as e:
+            print(f"[WS-{ws_id}] [ERROR] Invalid stream header: {e}")
+            await websocket.close()
+            return
 
         # Receive the full WAV buffer from the WebSocket
         audio_buffer = bytearray()
         while True:
             message = await websocket.recv()
+            if recorder:
+                recorder.record(message)
             if isinstance(message, bytes):
                 audio_buffer.extend(message)
             elif isinstance(message, str) and message.upper() == "END":
+                timing["end"] = time.perf_counter()
+                ticket = next_ticket
+                next_ticket += 1
                 print(f"[WS-{ws_id}] Received END signal from client.")
                 break
             else:
@@ -126,31 +470,38 @@ async def handle_audio_stream(websocket, path):
             print(f"[WS-{ws_id}] [WARN] Received empty audio buffer. Nothing to process.")
             return
             
-        print(f"[WS-{ws_id}] Received {len(audio_buffer)} bytes of audio data. Decoding WAV...")
+        print(f"[WS-{ws_id}] Received {len(audio_buffer)} bytes of audio data. Decoding {audio_format.upper()}...")
 
-        # Decode WAV to float32 PCM
+        # Decode to float32 PCM on the decode pool, in memory
         try:
-            audio_io = io.BytesIO(audio_buffer)
-            with sf.SoundFile(audio_io, 'r') as sf_file:
-                audio_data_raw = sf_file.read(dtype="float32")
+            audio_data_raw, file_samplerate = await audio_codec.decode_audio_async(audio_buffer, audio_format)
+            if audio_format in audio_codec.COMPRESSED_FORMATS:
+                # Compressed streams carry their own rate; the header rate describes the WAV path only.
+                samplerate = file_samplerate
+            elif file_samplerate != samplerate:
                 # Validate samplerate from header against file, prioritize header.
-                if sf_file.samplerate != samplerate:
-                    print(f"[WS-{ws_id}] [WARN] Samplerate mismatch: Header={samplerate}, File={sf_file.samplerate}. Using header rate.")
-            print(f"[WS-{ws_id}] Decoded audio: shape={audio_data_raw.shape}, samplerate from header={samplerate}")
+                print(f"[WS-{ws_id}] [WARN] Samplerate mismatch: Header={samplerate}, File={file_samplerate}. Using header rate.")
+            timing["decoded"] = time.perf_counter()
+            print(f"[WS-{ws_id}] Decoded audio: shape={audio_data_raw.shape}, samplerate={samplerate}")
         except Exception as e:
-            print(f"[WS-{ws_id}] Failed to decode WAV: {e}")
+            print(f"[WS-{ws_id}] Failed to decode {audio_format.upper()}: {e}")
             return
 
-        # Only mono audio is supported by Audio2Face typically
-        if len(audio_data_raw.shape) > 1:
-            audio_data_mono = np.average(audio_data_raw, axis=1)
+        # Audio2Face takes mono; downmix and level the utterance on the decode pool
+        loop = asyncio.get_running_loop()
+        audio_data_mono, stats = await loop.run_in_executor(audio_codec.get_decode_pool(), conditioner.process,
+                                                            audio_data_raw)
+        if stats["conditioned"]:
+            print(f"[WS-{ws_id}] Conditioned audio: {stats['channels']} ch, input {stats['rms_in_db']} dBFS RMS, "
+                  f"gain {stats['gain_db']:+.1f} dB{', peak limited' if stats['peak_limited'] else ''}")
+        elif stats["channels"] > 1:
             print(f"[WS-{ws_id}] Audio converted to mono.")
-        else:
-            audio_data_mono = audio_data_raw
 
-        # Put the processed audio data and samplerate into the queue
-        await audio_queue.put((audio_data_mono, samplerate, ws_id))
-        print(f"[WS-{ws_id}] Audio data added to the processing queue.")
+        # Queued behind every utterance whose END arrived first, even if those are still decoding
+        if ticket > next_to_queue:
+            print(f"[WS-{ws_id}] Waiting for {ticket - next_to_queue} earlier utterance(s) to finish decoding.")
+        release_ticket(ticket, (audio_data_mono, samplerate, ws_id, emotion, timing))
+        ticket = None
 
     except websockets.exceptions.ConnectionClosed:
         print(f"[WS-{ws_id}] Connection closed normally by client.")
@@ -161,49 +512,263 @@ async def handle_audio_stream(websocket, path):
     except Exception as e:
         print(f"[WS-{ws_id}] Unexpected error in handle_audio_stream: {e}")
     finally:
+        if ticket is not None:
+            release_ticket(ticket, None)  # dropped; later utterances must not wait for it
+        if recorder:
+            try:
+                path = await asyncio.to_thread(recorder.save)
+                if path:
+                    print(f"[WS-{ws_id}] Session recorded to {path}")
+            except OSError as e:
+                print(f"[WS-{ws_id}] [WARN] Failed to save session recording: {e}")
         print(f"[WS-{ws_id}] Client disconnected.")
         # WebSocket is automatically closed when handler exits or due to `async with websockets.serve`
 
+def pending_items():
+    """Takes every utterance that has not started playing off the queue, in spill form."""
+    items = []
+    now_wall, now_perf = time.time(), time.perf_counter()
+    while not audio_queue.empty():
+        audio_data, samplerate, ws_id, emotion, timing = audio_queue.get_nowait()
+        audio_queue.task_done()
+        queued_at = now_wall - (now_perf - timing.get("enqueued", now_perf))
+        items.append((audio_data, samplerate, ws_id, emotion, queued_at))
+    return items
+
+
+def restore_items(items):
+    """Queues spilled utterances ahead of anything received since this process started."""
+    newer = []
+    while not audio_queue.empty():
+        newer.append(audio_queue.get_nowait())
+        audio_queue.task_done()
+    for audio_data, samplerate, ws_id, emotion, _ in items:
+        audio_queue.put_nowait((audio_data, samplerate, ws_id, emotion, {"enqueued": time.perf_counter()}))
+    for item in newer:
+        audio_queue.put_nowait(item)
+
+
+async def restore_spill():
+    """
+    Loads the queue left by the previous process: as a hot-reload successor, waits for the
+    old process to finish its in-flight utterance and write the hand-off spill; otherwise
+    picks up SPILL_FILE from the last shutdown, if any.
+    """
+    if handoff.is_successor():
+        print("[Handoff] Waiting for the previous process to finish its in-flight utterance...")
+        path = await asyncio.to_thread(handoff.wait_for_spill, DRAIN_TIMEOUT + HANDOFF_TIMEOUT)
+        if path is None:
+            print("[Handoff] [WARN] No spill file from the previous process, starting with an empty queue.")
+            return
+        max_age = None
+    else:
+        path, max_age = SPILL_FILE, SPILL_MAX_AGE
+    try:
+        items, dropped = await asyncio.to_thread(handoff.take_spill, path, max_age)
+    except Exception as e:
+        print(f"[Spill] [WARN] Could not load queued audio from {path}: {e}")
+        return
+    if dropped:
+        print(f"[Spill] [WARN] Dropped {dropped} utterance(s) older than {SPILL_MAX_AGE:.0f}s from {path}")
+    if items:
+        restore_items(items)
+        print(f"[Spill] Restored {len(items)} queued utterance(s) from {path}")
+
+
+async def stop_processor(processor_task, abort=False):
+    """
+    Stops the processor before it takes the next utterance. The in-flight one plays to the
+    end (bounded by DRAIN_TIMEOUT) unless abort is set.
+    """
+    global processor_stopping
+    processor_stopping = True
+    if abort:
+        stream_abort.set()
+    if abort or not processor_busy:
+        processor_task.cancel()  # idle in audio_queue.get() or aborted; the queue keeps its items
+    try:
+        await asyncio.wait_for(asyncio.shield(processor_task), DRAIN_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"[Shutdown] [WARN] In-flight utterance still playing after {DRAIN_TIMEOUT:.0f}s, aborting it.")
+        stream_abort.set()
+        processor_task.cancel()
+        try:
+            await processor_task
+        except asyncio.CancelledError:
+            pass
+    except asyncio.CancelledError:
+        pass
+
+
+def stop_accepting(server_instance):
+    """
+    Stops taking connections off the listening sockets without closing the server, so
+    connections already accepted still complete their handshake. Later ones wait in the
+    kernel's accept backlog (for a hot-reload successor sharing the socket).
+    """
+    loop = asyncio.get_running_loop()
+    for sock in server_instance.sockets:
+        try:
+            loop.remove_reader(sock.fileno())  # selector loops: the accept callback is a reader
+        except NotImplementedError:
+            loop._stop_serving(sock)  # proactor loop (Windows): cancels the pending accept
+
+
+async def stop_listening(server_instance):
+    """
+    Stops accepting, waits for accepted connections to finish their handshake, then closes
+    the server and lets connected clients finish their uploads (up to DRAIN_TIMEOUT).
+    Closing first would answer handshakes still in progress with "503 Server is shutting down".
+    """
+    stop_accepting(server_instance)
+    deadline = time.monotonic() + DRAIN_TIMEOUT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.01)  # also lets just-accepted connections reach connection_made()
+        if not any(ws.state is State.CONNECTING for ws in server_instance.websockets):
+            break
+    server_instance.close(close_connections=False)
+    try:
+        await asyncio.wait_for(server_instance.wait_closed(), DRAIN_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"[Shutdown] [WARN] Uploads still open after {DRAIN_TIMEOUT:.0f}s, closing them.")
+        for websocket in list(server_instance.websockets):
+            await websocket.close(1001)
+    print("WebSocket server stopped accepting new connections and finished open uploads.")
+
+
+async def hot_reload(server_instance, processor_task):
+    """
+    Hands the listening socket and the pending queue to a new copy of this program.
+    Returns False, and keeps serving, if the successor does not come up.
+    """
+    if UNDER_PM2:
+        # PM2 would restart us on exit next to the successor holding the port, and lose track of it
+        print("[Handoff] [WARN] Hot reload is not supported under PM2, ignoring; send the 'drain' control message instead.")
+        return False
+    listeners = list(server_instance.sockets)
+    if len(listeners) != 1:
+        print(f"[Handoff] [WARN] Hot reload needs exactly one listening socket, have {len(listeners)}; "
+              f"set A2F_WS_HOST to a single address.")
+        return False
+    spill_path = f"{SPILL_FILE}.{os.getpid()}"
+    ack_path = f"{spill_path}.ack"
+    proc = handoff.spawn_successor(listeners[0], ack_path, spill_path)
+    print(f"[Handoff] Started successor PID {proc.pid}, waiting for it to listen...")
+    if not await asyncio.to_thread(handoff.wait_for_ack, proc, ack_path, HANDOFF_TIMEOUT):
+        print("[Handoff] [WARN] Successor did not start listening, cancelling reload and continuing to serve.")
+        if proc.poll() is None:
+            proc.kill()
+        return False
+    await stop_listening(server_instance)
+    await stop_processor(processor_task)
+    items = pending_items()
+    await asyncio.to_thread(handoff.write_spill, spill_path, items)
+    print(f"[Handoff] Handed {len(items)} queued utterance(s) to PID {proc.pid}.")
+    return True
+
+
+async def shutdown(server_instance, processor_task, mode):
+    """
+    "drain": finish open uploads and play out the queue (up to DRAIN_TIMEOUT).
+    "immediate": close connections and stop now.
+    Whatever has not played is spilled to SPILL_FILE for the next start.
+    """
+    if mode == "immediate":
+        server_instance.close()
+        await server_instance.wait_closed()
+        print("WebSocket server fully closed.")
+    else:
+        await stop_listening(server_instance)
+        print(f"[Shutdown] Draining {audio_queue.qsize()} queued utterance(s)...")
+        try:
+            await asyncio.wait_for(audio_queue.join(), DRAIN_TIMEOUT)
+            print("[Shutdown] Audio queue drained.")
+        except asyncio.TimeoutError:
+            print(f"[Shutdown] [WARN] Audio queue not drained after {DRAIN_TIMEOUT:.0f}s.")
+    await stop_processor(processor_task, abort=True)
+    items = pending_items()
+    if items:
+        await asyncio.to_thread(handoff.write_spill, SPILL_FILE, items)
+        print(f"[Shutdown] Spilled {len(items)} queued utterance(s) to {SPILL_FILE}, played on the next start.")
+
+
 async def main():
-    print("Starting WebSocket audio stream server on ws://0.0.0.0:8765")
-    
+    global a2f_channel, emotion_controller, loop_monitor
+    print(f"Starting WebSocket audio stream server on ws://{WS_HOST}:{WS_PORT}")
+    timings = [("light imports", _T_LIGHT_IMPORTS - _T_START), (".env", _T_DOTENV - _T_LIGHT_IMPORTS)]
+
+    # Heavy imports run on a worker thread while the listener binds
+    deps_task = asyncio.create_task(asyncio.to_thread(load_dependencies))
+
+    loop_monitor = LoopMonitor()
+    loop_monitor.start()
+    loop = asyncio.get_running_loop()
+    if hasattr(signal, "SIGUSR1"):  # not available on Windows; use the control message there
+        loop.add_signal_handler(signal.SIGUSR1, start_signal_profile)
+    if hasattr(signal, "SIGHUP"):  # POSIX; on Windows Ctrl+C and the "reload" control message remain
+        loop.add_signal_handler(signal.SIGHUP, request_shutdown, "reload")
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, request_shutdown, SHUTDOWN_MODE)
+
+    t0 = time.perf_counter()
+    listen_sock = handoff.inherited_socket()  # set when started by a hot reload
+    if listen_sock is not None:
+        server_instance = await websockets.serve(handle_audio_stream, sock=listen_sock, max_size=None, max_queue=None,
+                                                 process_request=health_check)
+        handoff.send_ack()
+        timings.append(("adopt handed-off listener", time.perf_counter() - t0))
+    else:
+        server_instance = await websockets.serve(handle_audio_stream, WS_HOST, WS_PORT, max_size=None, max_queue=None,
+                                                 process_request=health_check)
+        timings.append(("bind listener", time.perf_counter() - t0))
+    print(f"[Startup] Listening on ws://{WS_HOST}:{WS_PORT}")
+
+    t0 = time.perf_counter()
+    deps_seconds = await deps_task
+    timings.append((f"heavy imports (thread, {deps_seconds * 1000:.0f} ms)", time.perf_counter() - t0))
+
+    # Open the Audio2Face channel once and prime it before the first real utterance
+    a2f_channel = grpc.insecure_channel(A2F_GRPC_URL)
+    emotion_controller = emotion_controller_module.EmotionController()
+
+    # Queue from the previous process first; a successor waits here while its predecessor
+    # finishes the in-flight utterance, so warmup and playback never overlap with it
+    t0 = time.perf_counter()
+    await restore_spill()
+    timings.append(("restore queue", time.perf_counter() - t0))
+
+    warmup_task = asyncio.create_task(run_warmup())
+    ready_task = asyncio.create_task(announce_ready(warmup_task, timings))
+
     # Start the single audio processor worker task
     processor_task = asyncio.create_task(audio_processor())
-    
-    server_instance = await websockets.serve(handle_audio_stream, "0.0.0.0", 8765, max_size=None, max_queue=None)
-    
+
+    mode = SHUTDOWN_MODE
     try:
-        await asyncio.Future()  # Run forever until a signal (like KeyboardInterrupt)
+        while True:
+            await shutdown_requested.wait()
+            mode = shutdown_mode
+            if mode != "reload" or await hot_reload(server_instance, processor_task):
+                break
+            shutdown_requested.clear()
     except KeyboardInterrupt:
         print("\nKeyboardInterrupt received. Shutting down server...")
     except asyncio.CancelledError:
-        print("\nMain task cancelled. Shutting down server...") # e.g. if run in a larger app
+        print("\nMain task cancelled. Shutting down server...") # e.g. Ctrl+C on Windows, or run in a larger app
     finally:
-        print("Initiating shutdown sequence...")
-        # 1. Stop accepting new connections
-        server_instance.close()
-        print("WebSocket server stopped accepting new connections.")
-        await server_instance.wait_closed()
-        print("WebSocket server fully closed.")
-
-        # 2. Signal the processor task to stop and wait for it to finish processing queued items
-        #    or just cancel it if immediate shutdown is preferred.
-        #    For graceful shutdown, one might wait for audio_queue.join() before cancelling.
-        #    For now, direct cancellation:
-        if not processor_task.done():
-            processor_task.cancel()
-            try:
-                await processor_task
-            except asyncio.CancelledError:
-                print("Audio processor task successfully cancelled.")
-            except Exception as e:
-                print(f"Error during processor task cleanup: {e}")
-        
-        # Wait for the queue to be fully processed (optional, for graceful shutdown)
-        # print("Waiting for audio queue to empty...")
-        # await audio_queue.join() # This ensures all task_done() calls have happened
-        # print("Audio queue empty.")
+        print(f"Initiating shutdown sequence ({mode})...")
+        if mode != "reload":  # a reload has already stopped listening and handed off the queue
+            await shutdown(server_instance, processor_task, mode)
 
+        for task in (ready_task, warmup_task):
+            if not task.done():
+                task.cancel()
+        a2f_channel.close()
+        emotion_controller.close()
+        await loop_monitor.stop()
+        audio_codec.shutdown_decode_pool()
+        if mode != "reload":  # the successor owns the ready file now
+            clear_ready()
         print("Shutdown complete.")
 
 if __name__ == "__main__":
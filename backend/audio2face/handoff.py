@@ -0,0 +1,167 @@
+"""
+Zero-downtime restarts for grpc_client.py: queue spill files and listening-socket hand-off.
+
+Spill file layout (little endian), one per shutdown or hand-off:
+    b"A2FQ" | version u8 | item count u32
+    then per queued utterance:
+        samplerate u32 | queued at, unix time f64 | ws_id i32 | emotion length i16 (-1 = none)
+        | sample count u32 | emotion f32 * length | mono PCM f32 * sample count
+
+Hot reload, driven by grpc_client.py:
+    old process                             new process
+    spawn_successor(listener)  ---------->  inherited_socket(), bind, send_ack()
+    wait_for_ack()
+    stop listening, finish uploads
+    finish in-flight stream
+    write_spill(spill path)    ---------->  wait_for_spill(), play spilled items first
+    exit
+The listening socket never closes, so clients are not refused at any point; connections
+that arrive while the new process starts wait in the kernel's accept backlog.
+"""
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+MAGIC = b"A2FQ"
+VERSION = 1
+
+_FILE_HEADER = struct.Struct("<4sBI")
+_ITEM_HEADER = struct.Struct("<IdihI")
+
+# Set by the old process for its successor
+ENV_FD = "A2F_HANDOFF_FD"  # POSIX: inherited listening socket fd
+ENV_SHARE = "A2F_HANDOFF_SHARE"  # Windows: socket.share() bytes arrive on stdin
+ENV_ACK = "A2F_HANDOFF_ACK"  # file the successor creates once it is listening
+ENV_SPILL = "A2F_HANDOFF_SPILL"  # spill file the old process writes when it is done
+
+
+def write_spill(path, items):
+    """
+    Atomically writes queued utterances, a list of
+    (audio_data, samplerate, ws_id, emotion, queued_at), to `path`.
+    """
+    parts = [_FILE_HEADER.pack(MAGIC, VERSION, len(items))]
+    for audio_data, samplerate, ws_id, emotion, queued_at in items:
+        emotion = list(emotion) if emotion is not None else None
+        parts.append(_ITEM_HEADER.pack(int(samplerate), queued_at, int(ws_id),
+                                       -1 if emotion is None else len(emotion), len(audio_data)))
+        if emotion:
+            parts.append(struct.pack(f"<{len(emotion)}f", *emotion))
+        parts.append(audio_data.astype("<f4", copy=False).tobytes())
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(b"".join(parts))
+    os.replace(tmp, path)
+    return path
+
+
+def read_spill(path, max_age=None):
+    """
+    Returns ([(audio_data, samplerate, ws_id, emotion, queued_at)], dropped), skipping
+    items queued more than `max_age` seconds ago.
+    """
+    import numpy as np  # grpc_client.py only calls this after its heavy imports are loaded
+
+    with open(path, "rb") as f:
+        data = bytearray(f.read())  # writable, so the arrays below are too
+    magic, version, count = _FILE_HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not an A2FQ v{VERSION} spill file")
+    items = []
+    dropped = 0
+    now = time.time()
+    pos = _FILE_HEADER.size
+    for _ in range(count):
+        samplerate, queued_at, ws_id, n_emotion, n_samples = _ITEM_HEADER.unpack_from(data, pos)
+        pos += _ITEM_HEADER.size
+        emotion = None
+        if n_emotion >= 0:
+            emotion = list(struct.unpack_from(f"<{n_emotion}f", data, pos))
+            pos += 4 * n_emotion
+        audio_data = np.frombuffer(data, dtype="<f4", count=n_samples, offset=pos)
+        pos += 4 * n_samples
+        if max_age and now - queued_at > max_age:
+            dropped += 1
+            continue
+        items.append((audio_data, samplerate, ws_id, emotion, queued_at))
+    return items, dropped
+
+
+def take_spill(path, max_age=None):
+    """read_spill() and delete the file; returns ([], 0) when there is none."""
+    if not os.path.exists(path):
+        return [], 0
+    try:
+        return read_spill(path, max_age)
+    finally:
+        os.remove(path)
+
+
+def spawn_successor(listener, ack_path, spill_path):
+    """Starts a new copy of this program that takes over `listener`. Returns the Popen."""
+    env = dict(os.environ, **{ENV_ACK: ack_path, ENV_SPILL: spill_path})
+    for path in (ack_path, spill_path):
+        if os.path.exists(path):
+            os.remove(path)
+    args = [sys.executable] + sys.argv
+    if os.name == "nt":
+        # Windows has no fd inheritance for sockets; duplicate it for the child's PID instead
+        env[ENV_SHARE] = "1"
+        proc = subprocess.Popen(args, env=env, stdin=subprocess.PIPE)
+        sock = socket.socket(fileno=listener.fileno())
+        try:
+            proc.stdin.write(sock.share(proc.pid))
+        finally:
+            sock.detach()  # the fd still belongs to the running server
+            proc.stdin.close()
+        return proc
+    env[ENV_FD] = str(listener.fileno())
+    return subprocess.Popen(args, env=env, pass_fds=(listener.fileno(),))
+
+
+def inherited_socket():
+    """In a successor process, returns the handed-off listening socket; None otherwise."""
+    fd = os.environ.pop(ENV_FD, None)
+    if fd is not None:
+        return socket.socket(fileno=int(fd))
+    if os.environ.pop(ENV_SHARE, None):
+        return socket.fromshare(sys.stdin.buffer.read())
+    return None
+
+
+def is_successor():
+    return ENV_SPILL in os.environ
+
+
+def send_ack():
+    ack_path = os.environ.pop(ENV_ACK, None)
+    if ack_path:
+        with open(ack_path, "w", encoding="utf-8") as f:
+            f.write(f"{os.getpid()}\n")
+
+
+def wait_for_ack(proc, ack_path, timeout):
+    """Blocks until the successor acknowledges; False if it exits or times out first."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if os.path.exists(ack_path):
+            os.remove(ack_path)
+            return True
+        if proc.poll() is not None:
+            return False
+        time.sleep(0.05)
+    return False
+
+
+def wait_for_spill(timeout):
+    """In a successor, blocks until the old process has written its spill file; returns the path or None."""
+    path = os.environ.pop(ENV_SPILL, None)
+    deadline = time.monotonic() + timeout
+    while path and time.monotonic() < deadline:
+        if os.path.exists(path):
+            return path
+        time.sleep(0.05)
+    return None
@@ -0,0 +1,312 @@
+"""
+Replays recorded grpc_client.py sessions (see session_recorder.py) against a fresh
+grpc_client.py wired to a fake Audio2Face, and checks per-stage latencies
+against a stored baseline.
+
+    # record in production
+    A2F_RECORD_DIR=recordings python grpc_client.py
+    # store a baseline, then check later builds against it
+    python replay_sessions.py recordings/ --speed 4 --update-baseline baseline.json
+    python replay_sessions.py recordings/ --speed 4 --baseline baseline.json
+
+Sessions are replayed on one timeline that keeps the recorded END order, so the client
+queues and plays them in the same order every run: sessions that did not overlap in the
+recording are sent one after another, with the recorded gap between one END and the next
+session's start, and overlapping ones run side by side on a shared clock. Gaps and
+message inter-arrival times are divided by --speed (0 sends everything as fast as
+possible); the fake A2F and the client's stream pacing are accelerated by the same
+factor. The baseline records the speed, and a compare at a different speed is refused.
+Exits 1 on a regression, 2 if the run cannot be compared.
+The "receive" stage reflects this script's send timing and is not gated by default.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import websockets
+
+from fake_a2f_server import serve as serve_fake_a2f
+from session_recorder import read_session
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STAGES = ("receive", "decode", "queue_wait", "first_chunk", "stream", "end_to_first_chunk")
+# "receive" is paced by this script's own send loop, not by grpc_client.py, so it is
+# reported but not gated unless asked for with --stages
+GATED_STAGES = tuple(s for s in STAGES if s != "receive")
+MIN_P95_SAMPLES = 20  # below this p95 is just the max of a handful of runs, too noisy to gate
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def is_control_session(records):
+    """True for a control-message session ({"control": ...} header); older recordings may contain them."""
+    if not records or not isinstance(records[0][2], str):
+        return False
+    try:
+        header = json.loads(records[0][2])
+    except ValueError:
+        return False
+    return isinstance(header, dict) and "control" in header
+
+
+def collect_sessions(paths):
+    """Reads every audio session; control sessions are skipped so replays never re-run them."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, f) for f in sorted(os.listdir(path)) if f.endswith(".a2fs"))
+        else:
+            files.append(path)
+    sessions = []
+    for path in files:
+        start, records = read_session(path)
+        if is_control_session(records):
+            print(f"[Replay] Skipping control session {os.path.basename(path)}")
+            continue
+        sessions.append((path, start, records))
+    return sessions
+
+
+def start_client(ws_port, a2f_port, stage_log, speed):
+    env = dict(os.environ)
+    env.update({
+        "A2F_GRPC_URL": f"127.0.0.1:{a2f_port}",
+        "A2F_WS_HOST": "127.0.0.1",
+        "A2F_WS_PORT": str(ws_port),
+        "A2F_STAGE_LOG": stage_log,
+        "A2F_RECORD_DIR": "",
+        # Keep anything left queued at terminate() away from the real spill file
+        "A2F_SPILL_FILE": os.path.join(os.path.dirname(stage_log), "spill.a2fq"),
+    })
+    if speed > 0:
+        interval = float(env.get("A2F_STREAM_SEND_INTERVAL", "0.04"))
+        env["A2F_STREAM_SEND_INTERVAL"] = str(interval / speed)
+    else:
+        env["A2F_STREAM_SEND_INTERVAL"] = "0"
+    return subprocess.Popen([sys.executable, os.path.join(HERE, "grpc_client.py")], env=env, cwd=HERE,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+
+
+def wait_ready(ws_port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{ws_port}/ready", timeout=1) as resp:
+                if resp.status == 200:
+                    return True
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.1)
+    return False
+
+
+def recorded_end(start, records):
+    """When the session sent its last message (normally END) in the recording, unix time."""
+    return start + sum(dt for _, dt, _ in records)
+
+
+def timeline_groups(sessions):
+    """Splits sessions, in start order, into groups that overlapped in the recording."""
+    groups = []
+    group_end = None
+    for session in sorted(sessions, key=lambda s: s[1]):
+        _, start, records = session
+        if groups and start < group_end:
+            groups[-1].append(session)
+            group_end = max(group_end, recorded_end(start, records))
+        else:
+            groups.append([session])
+            group_end = recorded_end(start, records)
+    return groups
+
+
+async def replay_one(uri, records, start_at, speed, previous_end, end_sent):
+    """
+    Sends one session from loop time `start_at`, each message at its recorded offset from
+    the session start. The last message waits for `previous_end`, the session whose END
+    came before this one's in the recording.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        await asyncio.sleep(max(0.0, start_at - loop.time()))
+        async with websockets.connect(uri, max_size=None) as ws:
+            t0 = loop.time()
+            offset = 0.0
+            for n, (_, dt, message) in enumerate(records):
+                offset += dt
+                if speed > 0:
+                    # Absolute deadlines, so per-message sleep overshoot does not add up
+                    await asyncio.sleep(max(0.0, t0 + offset / speed - loop.time()))
+                if n == len(records) - 1 and previous_end is not None:
+                    await previous_end.wait()
+                await ws.send(message)
+    finally:
+        end_sent.set()  # even if this session failed, so later ones are not held up
+
+
+async def replay_all(uri, sessions, speed):
+    loop = asyncio.get_running_loop()
+    end_sent = {path: asyncio.Event() for path, _, _ in sessions}
+    previous_end = {}
+    previous = None
+    for path, start, records in sorted(sessions, key=lambda s: recorded_end(s[1], s[2])):
+        previous_end[path] = end_sent[previous] if previous is not None else None
+        previous = path
+
+    last_end = None
+    for group in timeline_groups(sessions):
+        group_start = group[0][1]
+        # The next group starts the recorded gap after the previous group's last END went out
+        gap = (group_start - last_end) / speed if speed > 0 and last_end is not None else 0.0
+        t0 = loop.time() + gap
+        await asyncio.gather(*(
+            replay_one(uri, records, t0 + ((start - group_start) / speed if speed > 0 else 0.0), speed,
+                       previous_end[path], end_sent[path])
+            for path, start, records in group
+        ))
+        last_end = max(recorded_end(start, records) for _, start, records in group)
+
+
+def read_stage_log(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(rows):
+    summary = {}
+    for stage in STAGES:
+        values = sorted(r[stage] for r in rows if r.get(stage) is not None)
+        if not values:
+            continue
+        n = len(values)
+        summary[stage] = {
+            "count": n,
+            "p50_ms": values[n // 2],
+            "p95_ms": values[min(n - 1, int(n * 0.95))],
+            "max_ms": values[-1],
+        }
+    return summary
+
+
+def compare(summary, baseline, threshold, slack_ms, stages=GATED_STAGES, min_p95_samples=MIN_P95_SAMPLES):
+    """
+    Returns a list of regression descriptions (empty if within limits) for `stages`.
+    Compares p50, and p95 once both runs have at least min_p95_samples utterances.
+    """
+    failures = []
+    for stage, base in baseline.items():
+        if stage not in stages:
+            continue
+        cur = summary.get(stage)
+        if cur is None:
+            failures.append(f"{stage}: missing from this run")
+            continue
+        keys = ["p50_ms"]
+        if min(cur["count"], base["count"]) >= min_p95_samples:
+            keys.append("p95_ms")
+        for key in keys:
+            limit = base[key] * (1 + threshold) + slack_ms
+            if cur[key] > limit:
+                failures.append(f"{stage} {key}: {cur[key]:.1f} ms > limit {limit:.1f} ms (baseline {base[key]:.1f} ms)")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sessions", nargs="+", help="Session files (.a2fs) or directories of them")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed; 1 = original timing, 0 = no delays")
+    parser.add_argument("--baseline", help="Baseline JSON to compare against")
+    parser.add_argument("--update-baseline", metavar="PATH", help="Write this run's summary as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed relative slowdown (default 0.25)")
+    parser.add_argument("--slack-ms", type=float, default=5.0, help="Allowed absolute slowdown on top (default 5 ms)")
+    parser.add_argument("--stages", default=",".join(GATED_STAGES),
+                        help=f"Comma-separated stages to gate on (default: all but receive, {','.join(GATED_STAGES)})")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for all utterances to finish")
+    args = parser.parse_args()
+
+    sessions = collect_sessions(args.sessions)
+    if not sessions:
+        print("[Replay] No sessions found.")
+        return 2
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        # Queue wait and stream times scale with the replay speed, so only like-for-like runs compare
+        if "speed" not in baseline or "stages" not in baseline:
+            print(f"[Replay] {args.baseline} does not record its replay speed; re-create it with --update-baseline.")
+            return 2
+        if baseline["speed"] != args.speed:
+            print(f"[Replay] {args.baseline} was recorded at --speed {baseline['speed']:g}, "
+                  f"this run is at --speed {args.speed:g}; refusing to compare.")
+            return 2
+
+    fake_server, fake, a2f_port = serve_fake_a2f(0, args.speed)
+    ws_port = free_port()
+    stage_log = os.path.join(tempfile.mkdtemp(prefix="a2f_replay_"), "stages.jsonl")
+    client = start_client(ws_port, a2f_port, stage_log, args.speed)
+    try:
+        if not wait_ready(ws_port, 30):
+            print("[Replay] grpc_client.py did not become ready.")
+            return 2
+        print(f"[Replay] Replaying {len(sessions)} session(s) at {args.speed or 'max'}x")
+        t0 = time.monotonic()
+        asyncio.run(replay_all(f"ws://127.0.0.1:{ws_port}", sessions, args.speed))
+
+        # Sessions without audio never reach the processor, so only wait for the ones that do
+        expected = sum(1 for _, _, records in sessions if any(isinstance(m, bytes) and m for _, _, m in records))
+        deadline = time.monotonic() + args.timeout
+        while len(read_stage_log(stage_log)) < expected and time.monotonic() < deadline:
+            time.sleep(0.1)
+        rows = read_stage_log(stage_log)
+        print(f"[Replay] {len(rows)}/{expected} utterances completed in {time.monotonic() - t0:.1f}s, "
+              f"{fake.audio_seconds:.1f}s of audio reached the fake A2F")
+    finally:
+        client.terminate()
+        try:
+            client.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            client.kill()
+        fake_server.stop(0)
+
+    summary = summarize(rows)
+    for stage, s in summary.items():
+        print(f"  {stage:<20} p50 {s['p50_ms']:9.1f} ms   p95 {s['p95_ms']:9.1f} ms   max {s['max_ms']:9.1f} ms")
+
+    if args.update_baseline:
+        with open(args.update_baseline, "w", encoding="utf-8") as f:
+            json.dump({"speed": args.speed, "stages": summary}, f, indent=2)
+        print(f"[Replay] Baseline written to {args.update_baseline}")
+
+    if len(rows) < expected:
+        print("[Replay] FAIL: not every utterance completed.")
+        return 1
+    if baseline is not None:
+        stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+        failures = compare(summary, baseline["stages"], args.threshold, args.slack_ms, stages)
+        if failures:
+            print("[Replay] FAIL: latency regression")
+            for failure in failures:
+                print(f"  {failure}")
+            return 1
+        print("[Replay] PASS: within baseline thresholds")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,112 +1,294 @@
 from flask import Flask, request, jsonify
-import os, io, requests, soundfile as sf, time, re
+import os, io, time, threading, queue, uuid
+import grpc
+import audio2face_pb2_grpc
+from a2f_rest import A2FRestClient
+from a2f_stream import stream_requests
+from audio_codec import load_audio_file, resample
+from audio_index import get_index
+from audio_store import save_stream, copy_file
 
 app = Flask(__name__)
 
-A2F_REST_URL = "http://localhost:8011"
+A2F_REST_URL = os.environ.get("A2F_REST_URL", "http://localhost:8011")
 DEFAULT_PLAYER = os.environ.get("A2F_INSTANCE_NAME", "/World/audio2face/Player")
+A2F_GRPC_URL = os.environ.get("A2F_GRPC_URL", "localhost:50051")
+DEFAULT_STREAMING_PLAYER = os.environ.get("A2F_STREAMING_INSTANCE_NAME", "/World/audio2face/PlayerStreaming")
+# "rest": SetTrack/Play per file on a regular player; "grpc": one gapless PushAudioStream to the streaming player
+DEFAULT_MODE = os.environ.get("A2F_PLAYBACK_MODE", "rest")
+PLAYBACK_MODES = ("rest", "grpc")
 DEFAULT_DIR = os.environ.get("A2F_AUDIO_DIR", "C:/Users/mynam/Downloads/S2S-Lipsync-UnrealAvatar-Backend")
 
-def get_sorted_audio_indices(directory):
-    files = os.listdir(directory)
-    return sorted(int(m.group(1)) for m in
-                  (re.match(r"message_(\d+)\.wav$", f) for f in files)
-                  if m)
+MAX_FINISHED_JOBS = int(os.environ.get("A2F_MAX_FINISHED_JOBS", "200"))
+PLAYBACK_PADDING = 0.05  # stop this much before the estimated end of each track
+
+# One pooled client for every player thread; also records per-endpoint latency
+a2f = A2FRestClient(A2F_REST_URL)
+# Opened on the first grpc-mode job and kept for the life of the process
+a2f_channel = None
+a2f_channel_lock = threading.Lock()
+
+
+def get_a2f_channel():
+    global a2f_channel
+    with a2f_channel_lock:
+        if a2f_channel is None:
+            a2f_channel = grpc.insecure_channel(A2F_GRPC_URL)
+        return a2f_channel
+
+
+class PlaybackJob:
+    """One /push_audio request: play every message_N.wav >= start_index in dir_path on instance."""
+
+    def __init__(self, instance, dir_path, start_index, mode=DEFAULT_MODE):
+        self.id = uuid.uuid4().hex
+        self.mode = mode
+        self.instance = instance
+        self.dir_path = dir_path
+        self.start_index = start_index
+        self.status = "queued"  # queued -> playing -> done | cancelled | failed
+        self.error = None
+        self.details = []
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.status == "queued":
+            self.finish("cancelled")
+
+    def finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self.finished = time.time()
+
+    def to_dict(self):
+        audio_seconds = sum(d["duration"] for d in self.details)
+        wall_seconds = (self.finished or time.time()) - self.started if self.started else None
+        return {
+            "job_id": self.id,
+            "mode": self.mode,
+            "status": self.status,
+            "instance": self.instance,
+            "dir": self.dir_path,
+            "index": self.start_index,
+            "played": [d["file"] for d in self.details],
+            "details": self.details,
+            "audio_seconds": audio_seconds,
+            "wall_seconds": wall_seconds,
+            # Time not covered by audio: request round trips, pacing error and gaps between tracks
+            "gap_seconds": wall_seconds - audio_seconds if wall_seconds is not None else None,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class InstancePlayer:
+    """
+    Background player for one A2F player instance.
+    Jobs are drained strictly in order, so concurrent requests never fight over the same player.
+    """
+
+    def __init__(self, instance):
+        self.instance = instance
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name=f"player:{instance}", daemon=True)
+        self.thread.start()
+
+    def submit(self, job):
+        self.queue.put(job)
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job.cancelled.is_set():
+                continue
+            job.status = "playing"
+            job.started = time.time()
+            try:
+                if job.mode == "grpc":
+                    self.play_grpc(job)
+                else:
+                    self.play(job)
+                job.finish("cancelled" if job.cancelled.is_set() else "done")
+            except Exception as e:
+                job.finish("failed", f"Playback error: {e}")
+                print(f"[Player {self.instance}] Job {job.id} failed: {e}")
+
+    def play(self, job):
+        # Disable looping before playing
+        a2f.set_looping(self.instance, False)
+
+        # Play all messages >= index in order
+        index = get_index(job.dir_path)
+        entries = index.range_from(job.start_index)
+        if not entries:
+            raise RuntimeError("No audio files found")
+
+        # SetTrack for track n+1 is issued while track n is still playing, timed so it lands
+        # as n ends; SetTrack replaces the current track, so no Pause between tracks.
+        pending_track = a2f.submit(a2f.set_track, self.instance, entries[0].file_name)
+        try:
+            for n, entry in enumerate(entries):
+                fname = entry.file_name
+                if job.cancelled.is_set(): break
+                if pending_track is not None:
+                    pending_track.result()
+                    pending_track = None
+
+                # An unreadable file fails the job rather than being "played" for 0 s
+                duration = index.require_duration(entry)
+
+                # Play
+                pl = a2f.play(self.instance, fname)
+                end = time.monotonic() + max(0, duration - PLAYBACK_PADDING)
+
+                nxt = entries[n + 1] if n + 1 < len(entries) else None
+                if nxt is not None:
+                    lead = a2f.metrics.mean("/A2F/Player/SetTrack") or 0
+                    # Cancel cuts the wait short
+                    if not job.cancelled.wait(max(0, end - lead - time.monotonic())):
+                        pending_track = a2f.submit(a2f.set_track, self.instance, nxt.file_name)
+                job.cancelled.wait(max(0, end - time.monotonic()))
+
+                job.details.append({
+                    "file": fname,
+                    "play": pl,
+                    "duration": duration
+                })
+        finally:
+            if pending_track is not None:
+                # Let an in-flight SetTrack land first so it cannot restart the player after the Pause
+                pending_track.exception()
+            # Pause once the last track is done, or on cancel or error, so the player never keeps going
+            ps = a2f.pause(self.instance)
+            if job.details:
+                job.details[-1]["pause"] = ps
+
+    def play_grpc(self, job):
+        # Same files, streamed back to back through one PushAudioStream to a streaming player
+        entries = get_index(job.dir_path).range_from(job.start_index)
+        if not entries:
+            raise RuntimeError("No audio files found")
+
+        first_audio, samplerate = load_audio_file(entries[0].path)
+
+        def segments():
+            # Decoded as the stream reaches each file, resampled to the first file's rate
+            yield first_audio
+            for entry in entries[1:]:
+                audio, sr = load_audio_file(entry.path)
+                yield resample(audio, sr, samplerate)
+
+        def on_segment(n, segment):
+            job.details.append({"file": entries[n].file_name, "duration": len(segment) / samplerate})
+
+        stub = audio2face_pb2_grpc.Audio2FaceStub(get_a2f_channel())
+        response = stub.PushAudioStream(stream_requests(
+            self.instance, samplerate, segments(),
+            block_until_playback_is_finished=True,
+            should_stop=job.cancelled.is_set,
+            on_segment=on_segment))
+        if not response.success:
+            raise RuntimeError(f"PushAudioStream failed: {response.message}")
+
+
+jobs = {}
+jobs_lock = threading.Lock()
+players = {}
+players_lock = threading.Lock()
+
+
+def register_job(job):
+    with jobs_lock:
+        jobs[job.id] = job
+        finished = [j for j in jobs.values() if j.finished is not None]
+        if len(finished) > MAX_FINISHED_JOBS:
+            finished.sort(key=lambda j: j.finished)
+            for old in finished[:len(finished) - MAX_FINISHED_JOBS]:
+                del jobs[old.id]
+
+
+def get_player(instance):
+    with players_lock:
+        if instance not in players:
+            players[instance] = InstancePlayer(instance)
+        return players[instance]
+
 
 @app.route('/push_audio', methods=['POST'])
 def push_audio():
-    # Determine payload type and save file
+    # Determine payload type; everything is validated before anything is written to disk
     if request.content_type.startswith('multipart/form-data'):
         audio_file = request.files.get('audio')
         if not audio_file:
             return jsonify({"error":"No audio file"}), 400
-        instance = request.form.get('instance_name', DEFAULT_PLAYER)
-        dir_path = request.form.get('dir_path', DEFAULT_DIR)
-        index = request.form.get('index', '0')
-        file_name = f"message_{index}.wav"
-        save_path = os.path.join(dir_path, file_name)
-        os.makedirs(dir_path, exist_ok=True)
-        audio_file.save(save_path)
-
+        fields = request.form
     elif request.is_json:
-        data = request.get_json()
-        audio_fpath = data.get('audio_fpath')
-        instance = data.get('instance_name', DEFAULT_PLAYER)
-        dir_path = data.get('dir_path', DEFAULT_DIR)
-        index = data.get('index', '0')
+        fields = request.get_json()
+        audio_fpath = fields.get('audio_fpath')
         if not audio_fpath or not os.path.isfile(audio_fpath):
             return jsonify({"error":"Missing or invalid audio_fpath"}), 400
-        file_name = f"message_{index}.wav"
-        save_path = os.path.join(dir_path, file_name)
-        os.makedirs(dir_path, exist_ok=True)
-        with open(audio_fpath, 'rb') as src, open(save_path, 'wb') as dst:
-            dst.write(src.read())
     else:
         return jsonify({"error":"Unsupported Content-Type"}), 415
 
-    # Use a single requests.Session for all requests
-    sess = requests.Session()
-
-    # Disable looping before playing
-    try:
-        resp = sess.post(
-            f"{A2F_REST_URL}/A2F/Player/SetLooping",
-            json={"a2f_player": instance, "loop_audio": False},
-            timeout=5
-        )
-        resp.raise_for_status()
-    except Exception as e:
-        return jsonify({"error": f"Failed SetLooping: {e}", "response": getattr(resp, 'text', None)}), 500
-
-    # Play all messages >= index in order
-    try:
-        indices = get_sorted_audio_indices(dir_path)
-        if not indices:
-            return jsonify({"error":"No audio files found"}), 400
-
-        start_i = int(index)
-        play_results = []
-        for i in indices:
-            if i < start_i: continue
-            fname = f"message_{i}.wav"
-            fpath = os.path.join(dir_path, fname)
-
-            # Set track
-            st = sess.post(f"{A2F_REST_URL}/A2F/Player/SetTrack",
-                           json={"a2f_player":instance,"file_name":fname,"time_range":[0,-1]}, timeout=5)
-            st.raise_for_status()
-
-            # Play
-            pl = sess.post(f"{A2F_REST_URL}/A2F/Player/Play",
-                           json={"a2f_player":instance,"file_name":fname}, timeout=5)
-            pl.raise_for_status()
-
-            # Sleep for duration - short padding
-            with sf.SoundFile(fpath) as f:
-                duration = len(f)/f.samplerate
-            time.sleep(max(0, duration - 0.05))
-
-            # Pause
-            ps = sess.post(f"{A2F_REST_URL}/A2F/Player/Pause",
-                           json={"a2f_player":instance}, timeout=5)
-            ps.raise_for_status()
-
-            play_results.append({
-                "file":fname,
-                "play":pl.json(),
-                "pause":ps.json(),
-                "duration":duration
-            })
-
-        return jsonify({
-            "status":"success",
-            "played":[r["file"] for r in play_results],
-            "details":play_results,
-            "dir":dir_path
-        })
-
-    except Exception as e:
-        return jsonify({"error":f"Playback error: {e}"}), 500
+    instance = fields.get('instance_name')
+    mode = fields.get('mode', DEFAULT_MODE)
+    dir_path = fields.get('dir_path', DEFAULT_DIR)
+    index = fields.get('index', '0')
+    if not str(index).isdigit():
+        return jsonify({"error": f"Invalid index: {index}"}), 400
+    if mode not in PLAYBACK_MODES:
+        return jsonify({"error": f"Invalid mode: {mode}"}), 400
+
+    file_name = f"message_{index}.wav"
+    save_path = os.path.join(dir_path, file_name)
+    os.makedirs(dir_path, exist_ok=True)
+    if request.is_json:
+        meta = copy_file(audio_fpath, save_path)
+    else:
+        # Stream to disk in bounded chunks, picking up the WAV header on the way
+        meta = save_stream(audio_file.stream, save_path)
+    get_index(dir_path).add(index, save_path, meta)
+
+    instance = instance or (DEFAULT_STREAMING_PLAYER if mode == "grpc" else DEFAULT_PLAYER)
+
+    job = PlaybackJob(instance, dir_path, int(index), mode)
+    register_job(job)
+    get_player(instance).submit(job)
+    return jsonify({
+        "status": "queued",
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}",
+        "dir": dir_path
+    }), 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Unknown job"}), 404
+    job.cancel()
+    return jsonify(job.to_dict())
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return jsonify(a2f.metrics.snapshot())
+
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5001, debug=True)
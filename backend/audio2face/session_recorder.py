@@ -0,0 +1,85 @@
+"""
+Compact on-disk recording of grpc_client.py WebSocket sessions, for replay_sessions.py.
+
+File layout (little endian):
+    b"A2FS" | version u8 | session start, unix time f64
+    then one record per received message:
+        kind u8 | microseconds since the previous message u32 | payload length u32 | payload
+kind is KIND_TEXT (UTF-8, e.g. the JSON header or "END") or KIND_BINARY (audio bytes).
+"""
+import os
+import struct
+import time
+
+MAGIC = b"A2FS"
+VERSION = 1
+KIND_TEXT = 0
+KIND_BINARY = 1
+
+_FILE_HEADER = struct.Struct("<4sBd")
+_RECORD_HEADER = struct.Struct("<BII")
+
+RECORD_DIR = os.getenv("A2F_RECORD_DIR", "")  # empty disables recording
+
+
+class SessionRecorder:
+    """
+    Buffers one session's messages with their inter-arrival times in memory and
+    writes the file in one go on save(), so recording adds no I/O to the receive loop.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.start_time = time.time()
+        self._last = time.perf_counter()
+        self._records = []
+
+    def record(self, message):
+        now = time.perf_counter()
+        dt_us = min(int((now - self._last) * 1_000_000), 0xFFFFFFFF)
+        self._last = now
+        if isinstance(message, str):
+            self._records.append((KIND_TEXT, dt_us, message.encode("utf-8")))
+        else:
+            self._records.append((KIND_BINARY, dt_us, bytes(message)))
+
+    def save(self):
+        if not self._records:
+            return None
+        parts = [_FILE_HEADER.pack(MAGIC, VERSION, self.start_time)]
+        for kind, dt_us, payload in self._records:
+            parts.append(_RECORD_HEADER.pack(kind, dt_us, len(payload)))
+            parts.append(payload)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(b"".join(parts))
+        os.replace(tmp, self.path)
+        return self.path
+
+
+def new_recorder(ws_id, record_dir=None):
+    """Returns a recorder for a new session, or None when recording is disabled."""
+    record_dir = record_dir if record_dir is not None else RECORD_DIR
+    if not record_dir:
+        return None
+    os.makedirs(record_dir, exist_ok=True)
+    name = f"session_{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}_{ws_id}.a2fs"
+    return SessionRecorder(os.path.join(record_dir, name))
+
+
+def read_session(path):
+    """Returns (start_time, [(kind, dt_seconds, message)]); message is str for text records, bytes otherwise."""
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, start_time = _FILE_HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not an A2FS v{VERSION} session recording")
+    records = []
+    pos = _FILE_HEADER.size
+    while pos < len(data):
+        kind, dt_us, length = _RECORD_HEADER.unpack_from(data, pos)
+        pos += _RECORD_HEADER.size
+        payload = data[pos:pos + length]
+        pos += length
+        records.append((kind, dt_us / 1_000_000, payload.decode("utf-8") if kind == KIND_TEXT else payload))
+    return start_time, records
@@ -30,6 +30,8 @@ const DEEPGRAM_API_KEY = process.env.DEEPGRAM_API_KEY;
 const ELEVENLABS_API_KEY = process.env.ELEVENLABS_API_KEY;
 const OPENAI_API_KEY = process.env.OPENAI_API_KEY;
 const MODE = process.env.MODE || 'audio'; // Default to 'audio'
+// Format TTS audio is sent to grpc_client.py in: 'mp3' (decoded in-process by the client) or 'wav' (ffmpeg here)
+const A2F_AUDIO_FORMAT = (process.env.A2F_AUDIO_FORMAT || 'mp3').toLowerCase();
 
 // Initialize OpenAI client
 const openai = new OpenAI({ apiKey: OPENAI_API_KEY });
@@ -82,22 +84,22 @@ const convertMp3ToWavPcm16kMono = (mp3Buffer) => {
 };
 
 
-const sendWavToGrpcClient = async (wavBuffer, sampleRate = 16000, wsUrl = "ws://localhost:8765") => {
+const sendAudioToGrpcClient = async (audioBuffer, sampleRate = 16000, wsUrl = "ws://localhost:8765", format = 'wav') => {
   return new Promise((resolve, reject) => {
     const ws = new WebSocketClient(wsUrl);
     ws.binaryType = 'nodebuffer';
     ws.on('open', () => {
       // Send JSON header
-      ws.send(JSON.stringify({ sample_rate: sampleRate }));
-      // Send WAV buffer in chunks
+      ws.send(JSON.stringify({ sample_rate: sampleRate, format }));
+      // Send audio buffer in chunks
       const chunkSize = 4096;
-      for (let i = 0; i < wavBuffer.length; i += chunkSize) {
-        ws.send(wavBuffer.slice(i, i + chunkSize));
+      for (let i = 0; i < audioBuffer.length; i += chunkSize) {
+        ws.send(audioBuffer.slice(i, i + chunkSize));
       }
       // Send END signal
       ws.send("END");
       // Print log immediately after sending audio
-      console.log(`[Backend] Sent ${wavBuffer.length} bytes of WAV audio to grpc_client.py via WebSocket (${wsUrl})`);
+      console.log(`[Backend] Sent ${audioBuffer.length} bytes of ${format.toUpperCase()} audio to grpc_client.py via WebSocket (${wsUrl})`);
       ws.close();
       resolve();
     });
@@ -196,8 +198,13 @@ const handleLlmStream = async (prompt, ws, language = 'en') => {
             });
 
             if (MODE === 'audio-with-avatar') {
-              const wavBuffer = await convertMp3ToWavPcm16kMono(ttsAudioMp3);
-              await sendWavToGrpcClient(wavBuffer, 16000, "ws://localhost:8765");
+              if (A2F_AUDIO_FORMAT === 'wav') {
+                const wavBuffer = await convertMp3ToWavPcm16kMono(ttsAudioMp3);
+                await sendAudioToGrpcClient(wavBuffer, 16000, "ws://localhost:8765", 'wav');
+              } else {
+                // grpc_client.py decodes the MP3 in memory, no temp files or ffmpeg round trip
+                await sendAudioToGrpcClient(ttsAudioMp3, 16000, "ws://localhost:8765", 'mp3');
+              }
               console.log('[Backend] Sent TTS audio for sentence to grpc_client.py');
             } else {
               // In 'audio' mode, send the MP3 directly to the frontend
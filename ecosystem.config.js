@@ -19,7 +19,11 @@ module.exports = {
       script: "grpc_client.py",
       cwd: "./backend/audio2face",
       interpreter: "./backend/audio2face/.venv/Scripts/python.exe",
-      watch: false
+      watch: false,
+      // Let the client drain its queue when PM2 signals it (A2F_DRAIN_TIMEOUT, 120 s by default).
+      // On Windows PM2 kills it outright instead; restart with
+      // `python backend/audio2face/a2f_control.py drain --wait` there (see backend/README.md)
+      kill_timeout: 125000
     }
   ]
 };
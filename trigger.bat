@@ -10,14 +10,10 @@ start "" "C:\Users\mynam\AppData\Local\ov\pkg\audio2face-2023.2.0\audio2face_hea
 echo Starting all services with pm2 using ecosystem.config.js...
 start "" pm2 start "C:/Users/mynam/Downloads/holobox/ecosystem.config.js"
 
-timeout /t 10 /nobreak
-
-:: Run the new command to connect audio2face
+:: Connect audio2face: polls until A2F is up instead of a fixed wait
 echo Running connect_audio2face.py...
 python "C:/Users/mynam/Downloads/S2S-Lipsync-UnrealAvatar-Backend/audio2face/connect_a2f.py"
 
-timeout /t 2 /nobreak
-
 :: Minimize all windows using PowerShell
 @REM powershell -Command "(New-Object -ComObject Shell.Application).MinimizeAll()"
 